@@ -0,0 +1,147 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from db_connection import connect_to_db
+from classes import League
+from matches_table import parse_dates, uses_matches_table
+from score_matrix import matchup_markets
+
+LEAGUES = ['premier_league', 'championship', 'league_one', 'league_two']
+# probabilities are clipped before taking logs so that a certain-looking miss doesn't score infinity
+EPSILON = 1e-15
+
+
+def _prior_totals(played, dates, teams, column):
+    """
+    Totals of a column for every team over the matches played strictly before each date, as a dates x teams array.
+    """
+    per_date = played.pivot_table(index='parsed', columns='Team', values=column, aggfunc='sum')
+    per_date = per_date.reindex(index=dates, columns=teams).fillna(0)
+    cumulative = per_date.cumsum().values
+    # shift by one date so a team's own result, and any other game that day, isn't known at kickoff
+    return np.vstack([np.zeros((1, len(teams))), cumulative[:-1]])
+
+
+def _mean_of_played(averages, games):
+    """
+    Mean over the teams that have played of each row of averages, nan for dates before anyone has played. Used
+    instead of np.nanmean(), which warns about every such date.
+    """
+    has_played = games > 0
+    return np.where(has_played, averages, 0).sum(axis=1) / has_played.sum(axis=1)
+
+
+def _venue_ratings(played, dates, teams):
+    """
+    ATT and DEF of every team at one venue as of each date, following Team.set_stats(): a team's rounded average
+    divided by the rounded league average, where the league average is the mean of the team averages.
+
+    :return: (ATT, DEF, league average goals scored), the first two as dates x teams arrays
+    """
+    games = _prior_totals(played.assign(Games=1), dates, teams, 'Games')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_for = _prior_totals(played, dates, teams, 'GF') / games
+        average_against = _prior_totals(played, dates, teams, 'GA') / games
+        league_for = np.round(_mean_of_played(average_for, games), 3)
+        league_against = np.round(_mean_of_played(average_against, games), 3)
+        attack = np.round(np.round(average_for, 3) / league_for[:, np.newaxis], 3)
+        defence = np.round(np.round(average_against, 3) / league_against[:, np.newaxis], 3)
+    return attack, defence, league_for
+
+
+def backtest(league, engine, min_games=1):
+    """
+    Replays a league's season in date order, pricing every match with the ratings both teams had at kickoff.
+
+    :param league: name of league schema
+    :param engine: engine connected to the league schema
+    :param min_games: only price matches where both teams have played at least this many games at their venue
+    :return: DataFrame of priced matches with columns date, home_team, away_team, home_goals, away_goals,
+             home_xg, away_xg, home win, draw, away win, over
+    """
+    layout = 'matches' if uses_matches_table(engine) else 'team_tables'
+    league_instance = League(league, engine, layout)
+    data = league_instance.load_match_data(engine)
+    teams = list(league_instance.teams)
+    data = data.assign(parsed=pd.to_datetime(parse_dates(data.Date).values))
+    data = data[data.parsed.notnull()]
+    dates = np.sort(data.parsed.unique())
+    date_index = {d: i for i, d in enumerate(dates)}
+    team_index = {t: i for i, t in enumerate(teams)}
+
+    home_games = data[data.Venue == 'HOME']
+    away_games = data[data.Venue == 'AWAY']
+    home_att, home_def, home_average = _venue_ratings(home_games, dates, teams)
+    away_att, away_def, away_average = _venue_ratings(away_games, dates, teams)
+    home_played = _prior_totals(home_games.assign(Games=1), dates, teams, 'Games')
+    away_played = _prior_totals(away_games.assign(Games=1), dates, teams, 'Games')
+
+    row = np.array([date_index[d] for d in home_games.parsed.values])
+    home = np.array([team_index[t] for t in home_games.Team])
+    away = np.array([team_index[t] for t in home_games.Opponent])
+    # same formula and rounding as Team.expected_scored()
+    home_xg = np.round(home_att[row, home] * away_def[row, away] * home_average[row], 3)
+    away_xg = np.round(away_att[row, away] * home_def[row, home] * away_average[row], 3)
+    priced = ((home_played[row, home] >= min_games) & (away_played[row, away] >= min_games) &
+              np.isfinite(home_xg) & np.isfinite(away_xg))
+
+    predictions = pd.DataFrame({"date": home_games.parsed.values[priced],
+                                "home_team": home_games.Team.values[priced],
+                                "away_team": home_games.Opponent.values[priced],
+                                "home_goals": home_games.GF.values[priced].astype(int),
+                                "away_goals": home_games.GA.values[priced].astype(int),
+                                "home_xg": home_xg[priced],
+                                "away_xg": away_xg[priced]})
+    if predictions.empty:
+        for column in ["home win", "draw", "away win", "over"]:
+            predictions[column] = []
+        return predictions
+    markets = matchup_markets(predictions.home_xg.values, predictions.away_xg.values, lines=[2.5])
+    for column in ["home win", "draw", "away win"]:
+        predictions[column] = markets[column]
+    predictions["over"] = markets["over"][2.5]
+    return predictions.sort_values("date", kind='mergesort').reset_index(drop=True)
+
+
+def score(predictions):
+    """
+    Brier score and log-loss of the 1X2 and over 2.5 goals predictions of a backtest.
+
+    :param predictions: DataFrame from backtest()
+    :return: dictionary with keys matches, 1x2 brier, 1x2 log loss, over brier and over log loss
+    """
+    if predictions.empty:
+        return {"matches": 0}
+    probabilities = predictions[["home win", "draw", "away win"]].values
+    goal_difference = predictions.home_goals.values - predictions.away_goals.values
+    outcome = np.where(goal_difference > 0, 0, np.where(goal_difference == 0, 1, 2))
+    observed = np.zeros_like(probabilities)
+    observed[np.arange(len(outcome)), outcome] = 1
+    over = predictions.over.values
+    went_over = (predictions.home_goals.values + predictions.away_goals.values > 2.5).astype(float)
+    return {"matches": len(predictions),
+            "1x2 brier": ((probabilities - observed) ** 2).sum(axis=1).mean(),
+            "1x2 log loss": -np.log(np.clip(probabilities[np.arange(len(outcome)), outcome], EPSILON, 1)).mean(),
+            "over brier": ((over - went_over) ** 2).mean(),
+            "over log loss": -np.log(np.clip(np.where(went_over == 1, over, 1 - over), EPSILON, 1)).mean()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest predictions using the ratings each team had at kickoff.")
+    parser.add_argument("leagues", nargs="*", default=LEAGUES)
+    parser.add_argument("--min-games", type=int, default=3)
+    parser.add_argument("--output", default=None, help="write every priced match to this csv file")
+    args = parser.parse_args()
+    scores = []
+    all_predictions = []
+    for league_name in args.leagues:
+        start = time.perf_counter()
+        league_predictions = backtest(league_name, connect_to_db(league_name), args.min_games)
+        league_score = score(league_predictions)
+        league_score["seconds"] = round(time.perf_counter() - start, 3)
+        scores.append(pd.Series(league_score, name=league_name))
+        all_predictions.append(league_predictions.assign(league=league_name))
+    print(pd.DataFrame(scores).round(4))
+    if args.output:
+        pd.concat(all_predictions, ignore_index=True).to_csv(args.output, index=False)
@@ -0,0 +1,113 @@
+import argparse
+import glob
+import time
+import pandas as pd
+from bs4 import BeautifulSoup, SoupStrainer
+from benchmarks import fixture_page, season_results
+from classes import TEAMS
+from fixture_parser import parse_fixtures
+
+# every this many matches of the generated page is shown as postponed
+POSTPONED_EVERY = 7
+
+
+def parse_fixtures_bs4(page, date):
+    """
+    The fixture extraction read_fixtures() used before fixture_parser.py, kept as the baseline for the benchmark.
+
+    :param page: page text
+    :param date: date as shown on soccerway
+    :return: list of (home team, away team) for games on date that aren't postponed
+    """
+    only_td = SoupStrainer("td")
+    soup = BeautifulSoup(page, 'html.parser', parse_only=only_td)
+    dates = soup.find_all(class_='date no-repetition')
+    match_data = []
+    for d in dates:
+        if date == d.text:
+            score_time_status = d.find_next("td", class_="score-time status").find_next("a")
+            if not score_time_status.text.strip() == "-":
+                home_team = d.find_next("td", class_="team team-a").find_next("a").get('title')
+                away_team = d.find_next("td", class_="team team-b").find_next("a").get('title')
+                match_data.append((home_team, away_team))
+    return match_data
+
+
+def parse_fixtures_lxml(page, date):
+    return [(f.home, f.away) for f in parse_fixtures(page, date) if not f.status == "-"]
+
+
+def _time(function, page, date, repeats):
+    timings = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(page, date)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def generated_page(schema='league_two', seed=0):
+    """
+    Season page for a whole generated season of a league, in the layout of benchmarks.fixture_page(), so the parsers
+    can be compared without a saved soccerway page.
+
+    :param schema: league whose teams are used
+    :param seed: seed of the generated season
+    :return: page text
+    """
+    season = pd.concat(season_results(TEAMS[schema], seed), ignore_index=True)
+    return fixture_page(season, postponed=set(range(0, len(season), POSTPONED_EVERY)))
+
+
+def busiest_date(page):
+    """
+    :param page: page text
+    :return: the date with the most fixtures on the page as DD/MM/YY text, or "" if there are none
+    """
+    texts = [f.date.strftime("%d/%m/%y") for f in parse_fixtures(page) if not isinstance(f.date, str)]
+    return max(set(texts), key=texts.count) if texts else ""
+
+
+def benchmark(pages, date=None, repeats=5):
+    """
+    Times the BeautifulSoup and lxml fixture extractors on soccerway season pages and checks they agree.
+
+    :param pages: list of (name, page text)
+    :param date: date to extract (DD/MM/YY), defaults to the busiest date on each page
+    :param repeats: runs per parser, the fastest is reported
+    :return: list of (name, date, fixtures found, bs4 seconds, lxml seconds)
+    """
+    results = []
+    print("{:<40} {:>9} {:>8} {:>10} {:>10} {:>8}".format("page", "date", "matches", "bs4 (ms)", "lxml (ms)",
+                                                          "speedup"))
+    for name, page in pages:
+        page_date = date if date is not None else busiest_date(page)
+        bs4_time, bs4_result = _time(parse_fixtures_bs4, page, page_date, repeats)
+        lxml_time, lxml_result = _time(parse_fixtures_lxml, page, page_date, repeats)
+        if bs4_result != lxml_result:
+            print("Warning: parsers disagree on", name)
+        print("{:<40} {:>9} {:>8} {:>10.2f} {:>10.2f} {:>7.1f}x".format(name[-40:], page_date, len(lxml_result),
+                                                                       1000 * bs4_time, 1000 * lxml_time,
+                                                                       bs4_time / lxml_time))
+        results.append((name, page_date, len(lxml_result), bs4_time, lxml_time))
+    return results
+
+
+def read_pages(paths):
+    pages = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            pages.append((path, file.read()))
+    return pages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fixture parsers on soccerway season pages.")
+    parser.add_argument("pages", nargs="*", help="saved .html pages (globs allowed), defaults to a generated page")
+    parser.add_argument("--date", default=None, help="date to extract in DD/MM/YY format")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    files = sorted({p for pattern in args.pages for p in glob.glob(pattern)})
+    benchmark(read_pages(files) if files else [("generated league_two season", generated_page())], args.date,
+              args.repeats)
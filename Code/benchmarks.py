@@ -0,0 +1,302 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import feedparser
+import numpy as np
+import pandas as pd
+import sqlalchemy as sqla
+from sqlalchemy import text
+from db_connection import connect_to_db, set_backend, sqlite_path
+from http_cache import configure, store
+from classes import League, Team, TEAMS
+from fixture_fetcher import FIXTURE_URLS
+from fixture_parser import parse_fixtures
+from read_data import get_result_prob, prob_predictions, read_fixtures
+from ratings_cache import invalidate
+from prediction_cache import clear
+from ingest_log import high_water_mark
+from write_results import FEED_URLS, SCHEMAS, MATCH_COLUMNS, bulk_write, ingest_feed, matches_frame, \
+    prepare_df
+from create_home_away_tabes import TABLE_COLUMNS, aggregate_tables, replace_tables
+
+REPEATS = 7
+# matchdays written to the generated league before timing; the rest are replayed by the end-to-end stage
+PLAYED_MATCHDAYS = 30
+# a stage is reported as a regression when its median time is this much slower than the baseline
+TOLERANCE = 0.25
+# differences smaller than this are timer noise, whatever the percentage
+MIN_DIFFERENCE_MS = 0.5
+SEASON_START = datetime.date(2019, 8, 3)
+
+
+def round_robin(teams):
+    """
+    Double round-robin schedule using the circle method, every team playing once per matchday.
+
+    :param teams: team names, an even number of them
+    :return: list of matchdays, each a list of (home team, away team)
+    """
+    teams = list(teams)
+    if len(teams) % 2:
+        teams.append(None)
+    rounds = []
+    for r in range(len(teams) - 1):
+        pairs = []
+        for i in range(len(teams) // 2):
+            home, away = teams[i], teams[-1 - i]
+            if home is not None and away is not None:
+                pairs.append((home, away) if (r + i) % 2 else (away, home))
+        rounds.append(pairs)
+        teams = [teams[0]] + [teams[-1]] + teams[1:-1]
+    return rounds + [[(away, home) for home, away in pairs] for pairs in rounds]
+
+
+def season_results(teams, seed=0):
+    """
+    A generated season: every matchday of round_robin(teams) with Poisson distributed scores.
+
+    :return: list of dataframes with columns date, home_team, away_team, home_goals, away_goals, one per matchday
+    """
+    random_state = np.random.RandomState(seed)
+    strength = random_state.uniform(0.7, 1.3, len(teams))
+    index = {team: i for i, team in enumerate(teams)}
+    matchdays = []
+    for day, pairs in enumerate(round_robin(teams)):
+        date = (SEASON_START + datetime.timedelta(days=7 * day)).strftime("%m/%d/%Y")
+        home = np.array([strength[index[h]] / strength[index[a]] for h, a in pairs])
+        matchdays.append(pd.DataFrame({"date": date,
+                                       "home_team": [h for h, _ in pairs],
+                                       "away_team": [a for _, a in pairs],
+                                       "home_goals": random_state.poisson(1.45 * home),
+                                       "away_goals": random_state.poisson(1.15 / home)})[MATCH_COLUMNS])
+    return matchdays
+
+
+def generate_league(schema, matchdays, directory):
+    """
+    Creates a local SQLite copy of a league with the given results, written through bulk_write() and with the league
+    tables rebuilt from them.
+
+    :param schema: name of league schema
+    :param matchdays: dataframes of results from season_results()
+    :param directory: folder for the <schema>.db file
+    :return: engine from connect_to_db()
+    """
+    path = sqlite_path(schema, directory)
+    if os.path.exists(path):
+        os.remove(path)
+    teams = TEAMS[schema]
+    setup_engine = sqla.create_engine("sqlite:///" + path)
+    connection = setup_engine.connect()
+    for team in teams:
+        for venue in ['HOME', 'AWAY']:
+            connection.execute(text("""
+                CREATE TABLE `{} {}` (date VARCHAR(45) PRIMARY KEY, opponent VARCHAR(45), goals_for INT,
+                                     goals_against INT, total_goals INT, win INT, draw INT, loss INT)""".format(
+                team, venue)))
+    for table in ['league_table', 'home_league_table', 'away_league_table']:
+        connection.execute(text("CREATE TABLE {} (team VARCHAR(45) PRIMARY KEY, {})".format(
+            table, ", ".join(c + " INT" for c in TABLE_COLUMNS[1:]))))
+        connection.execute(text("INSERT INTO {} VALUES (:team, 0, 0, 0, 0, 0, 0, 0, 0)".format(table)),
+                           [{"team": team} for team in teams])
+    connection.close()
+    setup_engine.dispose()
+
+    engine = connect_to_db(schema)
+    if matchdays:
+        bulk_write(pd.concat(matchdays, ignore_index=True), engine)
+    replace_tables(aggregate_tables(League(schema, engine), engine), engine)
+    return engine
+
+
+def fixture_page(matchday, postponed=()):
+    """
+    Soccerway-style season page listing one or more matchdays.
+
+    :param matchday: dataframe with columns date, home_team, away_team
+    :param postponed: positions of matches shown as postponed, with "-" in the score/time cell
+    :return: page text
+    """
+    rows = []
+    for i, match in enumerate(matchday.itertuples(index=False)):
+        date = datetime.datetime.strptime(match.date, "%m/%d/%Y").strftime("%d/%m/%y")
+        rows.append('<tr class="match"><td class="day no-repetition">Sat</td>'
+                    '<td class="date no-repetition">{0}</td>'
+                    '<td class="team team-a"><a href="/teams/{1}/" title="{2}">{2}</a></td>'
+                    '<td class="score-time status"><a href="/matches/{1}/">{4}</a></td>'
+                    '<td class="team team-b"><a href="/teams/{1}/" title="{3}">{3}</a></td></tr>'.format(
+                        date, i, match.home_team, match.away_team, "-" if i in postponed else "15:00"))
+    return '<html><body><table class="matches"><tbody>{}</tbody></table></body></html>'.format("".join(rows))
+
+
+def results_feed(matchday):
+    """
+    RSS feed in the format read by write_results.parse_entry() with the results of one matchday.
+
+    :param matchday: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    :return: feed text
+    """
+    items = []
+    for match in matchday.itertuples(index=False):
+        items.append("<item><title>{0} v {1}</title><pubDate>{4}</pubDate>"
+                     "<description>&lt;b&gt;{0} {2} - {3} {1}&lt;/b&gt;</description></item>".format(
+                         match.home_team, match.away_team, match.home_goals, match.away_goals, match.date))
+    return "<?xml version='1.0'?><rss version='2.0'><channel><title>Results</title>{}</channel></rss>".format(
+        "".join(items))
+
+
+def _time(function, repeats, setup=None):
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summary(timings, items=1):
+    median = statistics.median(timings)
+    return {"median_ms": round(1000 * median, 3),
+            "min_ms": round(1000 * min(timings), 3),
+            "items": items,
+            "items_per_second": round(items / median, 1) if median else None}
+
+
+def run(schema='league_two', repeats=REPEATS, played=PLAYED_MATCHDAYS, seed=0, directory=None):
+    """
+    Generates a league and its recorded pages in a local folder, switches the process to them (SQLite backend, offline
+    HTTP cache) and times each stage of the prediction, ingest and scraping paths.
+
+    :param schema: league to generate
+    :param repeats: timed runs per stage, the median is reported
+    :param played: matchdays written before timing; repeats more are needed for the end-to-end stage
+    :param seed: seed for the generated results
+    :param directory: folder for the generated files, defaults to a new temporary folder
+    :return: dictionary mapping stage name to its timings summary
+    """
+    directory = directory or tempfile.mkdtemp(prefix="football_benchmarks_")
+    os.makedirs(directory, exist_ok=True)
+    set_backend('sqlite', directory)
+    configure(directory=os.path.join(directory, "http_cache"), offline=True)
+    teams = TEAMS[schema]
+    season = season_results(teams, seed)
+    if played + repeats + 1 > len(season):
+        raise ValueError("A {}-team season only has {} matchdays".format(len(teams), len(season)))
+    engine = generate_league(schema, season[:played], directory)
+    feed_key = {value: key for key, value in SCHEMAS.items()}[schema]
+    home_name, away_name = season[played].home_team[0], season[played].away_team[0]
+    results = {}
+
+    results["League.__init__"] = _summary(_time(lambda: League(schema, engine), repeats))
+    league = League(schema, engine)
+    results["League.load_match_data"] = _summary(_time(lambda: league.load_match_data(engine), repeats))
+    results["Team.__init__"] = _summary(_time(lambda: Team(home_name, engine, league, 'HOME'), repeats))
+    home = Team(home_name, engine, league, 'HOME')
+    away = Team(away_name, engine, league, 'AWAY')
+    results["Team.set_stats"] = _summary(_time(home.set_stats, repeats))
+    home.set_opposition(away)
+    away.set_opposition(home)
+    results["Team.xgf"] = _summary(_time(home.xgf, repeats))
+    results["get_result_prob"] = _summary(_time(lambda: get_result_prob(home, away), repeats))
+    results["League.ratings"] = _summary(_time(lambda: league.ratings(engine), repeats), len(teams))
+
+    def cold_caches():
+        invalidate(schema)
+        clear()
+    results["prob_predictions (cold)"] = _summary(_time(
+        lambda: prob_predictions(schema, home_name, 'HOME', away_name, 'AWAY'), repeats, cold_caches))
+    results["prob_predictions (cached)"] = _summary(_time(
+        lambda: prob_predictions(schema, home_name, 'HOME', away_name, 'AWAY'), repeats))
+
+    page = fixture_page(pd.concat(season[played:], ignore_index=True))
+    fixture_count = len(parse_fixtures(page))
+    results["parse_fixtures"] = _summary(_time(lambda: parse_fixtures(page), repeats), fixture_count)
+    store(FIXTURE_URLS[schema], fixture_page(season[played]).encode("utf-8"), encoding="utf-8")
+    next_date = datetime.datetime.strptime(season[played].date[0], "%m/%d/%Y").strftime("%d/%m/%y")
+    results["read_fixtures"] = _summary(_time(lambda: read_fixtures(schema, next_date), repeats, clear),
+                                        len(season[played]))
+
+    feed = feedparser.parse(results_feed(pd.concat(season[:played], ignore_index=True)))
+    entries = len(feed.entries)
+    results["prepare_df"] = _summary(_time(lambda: [prepare_df(feed, i) for i in range(entries)], repeats), entries)
+    dates = {entry.published for entry in feed.entries}
+    results["matches_frame"] = _summary(_time(lambda: matches_frame(feed, dates), repeats), entries)
+
+    # a matchday as it happens: the results feed is ingested and the next matchday's fixtures are priced, each repeat
+    # playing one more matchday of the generated season
+    high_water_mark(schema, engine)
+    upcoming = iter(range(played, played + repeats))
+    current = {}
+
+    def record_matchday():
+        day = next(upcoming)
+        store(FEED_URLS[feed_key], results_feed(season[day]).encode("utf-8"), encoding="utf-8")
+        store(FIXTURE_URLS[schema], fixture_page(season[day + 1]).encode("utf-8"), encoding="utf-8")
+        current["date"] = datetime.datetime.strptime(season[day + 1].date[0], "%m/%d/%Y").strftime("%d/%m/%y")
+
+    def matchday():
+        ingest_feed(feed_key)
+        read_fixtures(schema, current["date"])
+    results["end-to-end matchday"] = _summary(_time(matchday, repeats, record_matchday), len(season[played]))
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Prints the timings next to a baseline and lists stages that got slower.
+
+    :param results: dictionary from run()
+    :param baseline: dictionary from an earlier run(), e.g. loaded from a baseline file, or None
+    :param tolerance: fraction a median may grow by before it counts as a regression
+    :return: list of stage names that regressed
+    """
+    baseline = baseline or {}
+    regressions = []
+    print("{:<28} {:>11} {:>11} {:>14} {:>13} {:>8}".format("stage", "median ms", "min ms", "items/s",
+                                                            "baseline ms", "change"))
+    for stage, summary in results.items():
+        base = baseline.get(stage)
+        base_text, change_text = "-", ""
+        if base:
+            change = summary["median_ms"] / base["median_ms"] - 1 if base["median_ms"] else 0
+            base_text = "{:.3f}".format(base["median_ms"])
+            change_text = "{:+.0%}".format(change)
+            if change > tolerance and summary["median_ms"] - base["median_ms"] > MIN_DIFFERENCE_MS:
+                regressions.append(stage)
+                change_text += " !"
+        print("{:<28} {:>11.3f} {:>11.3f} {:>14} {:>13} {:>8}".format(stage, summary["median_ms"], summary["min_ms"],
+                                                                     summary["items_per_second"], base_text,
+                                                                     change_text))
+    if regressions:
+        print("\nSlower than baseline by more than {:.0%}: {}".format(tolerance, ", ".join(regressions)))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the prediction, ingest and scraping paths on generated data.")
+    parser.add_argument("--league", default='league_two', choices=list(SCHEMAS.values()))
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default=None, help="folder for the generated database and pages")
+    parser.add_argument("--baseline", default=None, help="json file from an earlier --save run to compare against")
+    parser.add_argument("--save", default=None, help="write this run's timings to a json file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    timings = run(args.league, args.repeats, seed=args.seed, directory=args.directory)
+    stored = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            stored = json.load(file)
+    slower = compare(timings, stored, args.tolerance)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(timings, file, indent=2, sort_keys=True)
+    sys.exit(1 if slower else 0)
@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# entry points of the mail service, ingest and command line scripts
+MODULES = ['classes', 'read_data', 'read_email', 'write_results', 'import_results', 'manual_team_data_entry',
+           'fixture_fetcher', 'prediction_cache', 'rolling_ratings', 'rating_fit', 'season_simulator', 'backtest']
+# packages that should only be loaded when plotting or fitting
+FORBIDDEN = ['matplotlib', 'scipy']
+# seconds a cold import of any one module may take
+BUDGET = 1.5
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+
+def check_module(module, forbidden=FORBIDDEN):
+    """
+    Imports a module in a fresh interpreter, so nothing is already cached, and times it.
+
+    :param module: module name
+    :param forbidden: package names that shouldn't be loaded by the import
+    :return: (seconds, list of forbidden packages that were loaded)
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", _CHILD.format(module=module, forbidden=forbidden)],
+                            cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["seconds"], result["loaded"]
+
+
+def check(modules=MODULES, budget=BUDGET, forbidden=FORBIDDEN):
+    """
+    :param modules: module names to import
+    :param budget: seconds each import may take
+    :param forbidden: package names that no import may load
+    :return: list of failure messages, empty if every module passed
+    """
+    failures = []
+    for module in modules:
+        try:
+            seconds, loaded = check_module(module, forbidden)
+        except subprocess.CalledProcessError as e:
+            failures.append("{} failed to import:\n{}".format(module, e.stderr.strip()))
+            continue
+        print("{:<25} {:>7.3f}s {}".format(module, seconds, ", ".join(loaded)))
+        if seconds > budget:
+            failures.append("{} took {:.3f}s to import, budget is {}s".format(module, seconds, budget))
+        if loaded:
+            failures.append("{} loaded {}".format(module, ", ".join(loaded)))
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that modules import quickly and without plotting packages.")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--budget", type=float, default=BUDGET, help="seconds each import may take")
+    args = parser.parse_args()
+    problems = check(args.modules, args.budget)
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
@@ -1,19 +1,50 @@
 import pandas as pd
-from scipy.stats import gamma
-import matplotlib.pyplot as plt
-import math
 import numpy as np
+from score_matrix import goal_vector, matchup_markets
+from matches_table import read_matches
+from tracing import traced
+from plotting import plot_goals
+
+
+TEAMS = {'premier_league': ["AFC Bournemouth", "Arsenal", "Aston Villa", "Brighton & Hove Albion", "Burnley", "Chelsea",
+                            "Crystal Palace", "Everton", "Leicester City", "Liverpool", "Manchester City",
+                            "Manchester United", "Newcastle United", "Norwich City", "Sheffield United", "Southampton",
+                            "Tottenham Hotspur", "Watford", "West Ham United", "Wolverhampton Wanderers"],
+         'championship': ["Barnsley", "Birmingham City", "Blackburn Rovers", "Brentford", "Bristol City",
+                          "Cardiff City", "Charlton Athletic", "Derby County", "Fulham", "Huddersfield Town",
+                          "Hull City", "Leeds United", "Luton Town", "Middlesbrough", "Millwall", "Nottingham Forest",
+                          "Preston North End", "Queens Park Rangers", "Reading", "Sheffield Wednesday", "Stoke City",
+                          "Swansea City", "West Bromwich Albion", "Wigan Athletic"],
+         'league_one': ["Accrington Stanley", "AFC Wimbledon", "Blackpool", "Bolton Wanderers", "Bristol Rovers",
+                        "Burton Albion", "Coventry City", "Doncaster Rovers", "Fleetwood Town", "Gillingham",
+                        "Ipswich Town", "Lincoln City", "Milton Keynes Dons", "Oxford United", "Peterborough United",
+                        "Portsmouth", "Rochdale", "Rotherham United", "Shrewsbury Town", "Southend United",
+                        "Sunderland", "Tranmere Rovers", "Wycombe Wanderers"],
+         'league_two': ["Bradford City", "Cambridge United", "Carlisle United", "Cheltenham Town", "Colchester United",
+                        "Crawley Town", "Crewe Alexandra", "Exeter City", "Forest Green Rovers", "Grimsby Town",
+                        "Leyton Orient", "Macclesfield Town", "Mansfield Town", "Morecambe", "Newport County",
+                        "Northampton Town", "Oldham Athletic", "Plymouth Argyle", "Port Vale", "Salford City",
+                        "Scunthorpe United", "Stevenage", "Swindon Town", "Walsall"]}
 
 
 class League:
-    def __init__(self, name, engine):
+    @traced("League.__init__")
+    def __init__(self, name, engine, layout='team_tables', since=None, until=None):
         """
         Creates instance of League class for a league.
 
         :param name: name of league schema
         :param engine:
+        :param layout: where match data is read from, 'team_tables' for each team's HOME and AWAY table or 'matches'
+                       for the matches table (see matches_table.py)
+        :param since: with the 'matches' layout, only read matches on or after this date
+        :param until: with the 'matches' layout, only read matches on or before this date
         """
         valid_names = ['premier_league', 'championship', 'league_one', 'league_two']
+        self.__match_data = None
+        self.layout = layout
+        self.since = since
+        self.until = until
         if name in valid_names:
             self.name = name
             connection = engine.connect()
@@ -68,31 +99,162 @@ class League:
     def get_away_stats(self):
         return self.__away_stats
 
+    def load_match_data(self, engine):
+        """
+        Reads the HOME and AWAY tables of every team in the league with a single UNION ALL query, or the matches
+        table with one date-restricted query. Team instances created for this league afterwards are built from slices
+        of the result instead of querying the database.
+
+        :param engine: engine connected to the league schema
+        :return: DataFrame of every match with columns Team, Venue, Date, Opponent, GF, GA, TG, W, D, L
+        """
+        connection = engine.connect()
+        if self.layout == 'matches':
+            data = read_matches(connection, since=self.since, until=self.until)
+        else:
+            data = connection.execute(self.team_tables_query()).fetchall()
+        connection.close()
+        match_columns = ['Team', 'Venue', 'Date', 'Opponent', 'GF', 'GA', 'TG', 'W', 'D', 'L']
+        self.__match_data = pd.DataFrame(data, columns=match_columns)
+        self.__match_groups = {key: group.drop(columns=['Team', 'Venue']).reset_index(drop=True)
+                               for key, group in self.__match_data.groupby(['Team', 'Venue'])}
+        return self.__match_data
+
+    def team_tables_query(self):
+        """
+        UNION ALL of every team's HOME and AWAY table, with the columns team, venue, date, opponent, goals_for,
+        goals_against, total_goals, win, draw, loss
+
+        :return: SQL string
+        """
+        selects = []
+        for team in self.teams:
+            for venue in ['HOME', 'AWAY']:
+                selects.append("SELECT '{0}' AS team, '{1}' AS venue, t.* FROM {2}.{3} t".format(
+                    team.replace("'", "''"), venue, str("`" + self.name + "`"), str("`" + team + " " + venue + "`")))
+        return "\nUNION ALL\n".join(selects)
+
+    def get_match_data(self):
+        return self.__match_data
+
+    def team_match_data(self, team, venue):
+        """
+        Slice of the frame read by load_match_data() for one team and venue.
+
+        :param team: team name
+        :param venue: 'HOME' or 'AWAY'
+        :return: DataFrame with columns Date, Opponent, GF, GA, TG, W, D, L, or None if load_match_data() has not run
+        """
+        if self.__match_data is None:
+            return None
+        empty = pd.DataFrame(columns=['Date', 'Opponent', 'GF', 'GA', 'TG', 'W', 'D', 'L'])
+        return self.__match_groups.get((team, venue), empty)
+
+    def ratings(self, engine):
+        """
+        ATT and DEF of every team at home and away, loading the league's match data first if needed. The columns
+        line up with the arguments of matchup_matrix(), e.g. league.matchup_matrix(**league.ratings(engine)).
+
+        :param engine: engine connected to the league schema
+        :return: DataFrame indexed by team with columns home_att, home_def, away_att, away_def
+        """
+        if self.__match_data is None:
+            self.load_match_data(engine)
+        data = []
+        for team in self.teams:
+            home = Team(team, engine, self, 'HOME').get_stats()
+            away = Team(team, engine, self, 'AWAY').get_stats()
+            data.append([home.ATT, home.DEF, away.ATT, away.DEF])
+        return pd.DataFrame(data, index=pd.Index(self.teams, name='Team'),
+                            columns=['home_att', 'home_def', 'away_att', 'away_def'])
+
+    def matchup_matrix(self, home_att, home_def, away_att, away_def, lines=None):
+        """
+        Expected goals and market probabilities for every home/away pairing in the league, priced in one batch.
+        Ratings are given either in the order of self.teams or as pandas Series indexed by team name.
+
+        :param home_att: ATT of each team at home
+        :param home_def: DEF of each team at home
+        :param away_att: ATT of each team away
+        :param away_def: DEF of each team away
+        :param lines: over/under goal lines to price, defaults to score_matrix.OVER_UNDER_LINES
+        :return: dictionary of N x N DataFrames (home teams as rows, away teams as columns) with keys "home xg",
+                 "away xg", "home win", "draw", "away win" and "btts"; "over" and "under" map each line to a
+                 DataFrame. Teams playing themselves are NaN.
+        """
+        home_att, home_def, away_att, away_def = [self._team_vector(r) for r in (home_att, home_def,
+                                                                                 away_att, away_def)]
+        home_xg = np.outer(home_att, away_def) * self.__home_stats.aGF.values[0]
+        away_xg = np.outer(home_def, away_att) * self.__away_stats.aGF.values[0]
+        np.fill_diagonal(home_xg, np.nan)
+        np.fill_diagonal(away_xg, np.nan)
+        markets = matchup_markets(home_xg, away_xg, lines=lines)
+
+        def grid(values):
+            return pd.DataFrame(values, index=pd.Index(self.teams, name='HOME'),
+                                columns=pd.Index(self.teams, name='AWAY'))
+
+        matchups = {"home xg": grid(home_xg), "away xg": grid(away_xg)}
+        for market in ["home win", "draw", "away win", "btts"]:
+            matchups[market] = grid(markets[market])
+        for market in ["over", "under"]:
+            matchups[market] = {line: grid(p) for line, p in markets[market].items()}
+        return matchups
+
+    def _team_vector(self, ratings):
+        if isinstance(ratings, pd.Series):
+            return ratings.reindex(self.teams).values.astype(float)
+        return np.asarray(ratings, dtype=float)
+
+    def zone(self, position):
+        """
+        Zone that a league position belongs to
+
+        :param position: position in the league table, starting from 1
+        :return: -1 if in bottom 3; +1 if in top 3; +2 if in top 6; 0 otherwise
+        """
+        if self.team_count:
+            difference = self.team_count - position
+            if difference <= 2:
+                return -1
+            elif difference >= self.team_count - 3:
+                return 1
+            elif difference >= self.team_count - 6:
+                return 2
+            else:
+                return 0
+        else:
+            return False
+
     def team_list(self):
-        team_dict = {'premier_league': ["AFC Bournemouth", "Arsenal", "Aston Villa", "Brighton & Hove Albion",
-                                        "Burnley", "Chelsea", "Crystal Palace", "Everton", "Leicester City",
-                                        "Liverpool", "Manchester City", "Manchester United", "Newcastle United",
-                                        "Norwich City", "Sheffield United", "Southampton", "Tottenham Hotspur",
-                                        "Watford", "West Ham United", "Wolverhampton Wanderers"],
-                     'championship': ["Barnsley", "Birmingham City", "Blackburn Rovers", "Brentford", "Bristol City",
-                                      "Cardiff City", "Charlton Athletic", "Derby County", "Fulham",
-                                      "Huddersfield Town", "Hull City", "Leeds United", "Luton Town", "Middlesbrough",
-                                      "Millwall", "Nottingham Forest", "Preston North End", "Queens Park Rangers",
-                                      "Reading", "Sheffield Wednesday", "Stoke City", "Swansea City",
-                                      "West Bromwich Albion", "Wigan Athletic"],
-                     'league_one': ["Accrington Stanley", "AFC Wimbledon", "Blackpool", "Bolton Wanderers",
-                                    "Bristol Rovers", "Burton Albion", "Coventry City", "Doncaster Rovers",
-                                    "Fleetwood Town", "Gillingham", "Ipswich Town", "Lincoln City",
-                                    "Milton Keynes Dons", "Oxford United", "Peterborough United", "Portsmouth",
-                                    "Rochdale", "Rotherham United", "Shrewsbury Town", "Southend United", "Sunderland",
-                                    "Tranmere Rovers", "Wycombe Wanderers"],
-                     'league_two': ["Bradford City", "Cambridge United", "Carlisle United", "Cheltenham Town",
-                                    "Colchester United", "Crawley Town", "Crewe Alexandra", "Exeter City",
-                                    "Forest Green Rovers", "Grimsby Town", "Leyton Orient", "Macclesfield Town",
-                                    "Mansfield Town", "Morecambe", "Newport County", "Northampton Town",
-                                    "Oldham Athletic", "Plymouth Argyle", "Port Vale", "Salford City",
-                                    "Scunthorpe United", "Stevenage", "Swindon Town", "Walsall"]}
-        return team_dict[self.name]
+        return TEAMS[self.name]
+
+
+class TeamStats:
+    """
+    Season statistics of a team at one venue, held as plain numbers. to_frame() gives the one-row DataFrame layout.
+    """
+    __slots__ = ['GF', 'GA', 'TG', 'Games', 'aGF', 'aGA', 'aTG', 'OU', 'W', 'D', 'L', 'ATT', 'DEF', 'xGF', 'xgs']
+    COLUMNS = ['GF', 'GA', 'TG', 'Games', 'aGF', 'aGA', 'aTG', 'O/U', 'W', 'D', 'L', 'ATT', 'DEF', 'xGF', 'xgs']
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            setattr(self, field, values.get(field, 0))
+
+    def to_frame(self):
+        """
+        :return: one-row DataFrame with the columns of COLUMNS
+        """
+        return pd.DataFrame([[getattr(self, field) for field in self.__slots__]], columns=self.COLUMNS)
+
+    def __repr__(self):
+        return "TeamStats({})".format(", ".join("{}={}".format(column, getattr(self, field))
+                                                for column, field in zip(self.COLUMNS, self.__slots__)
+                                                if field != 'xgs'))
+
+
+def _per_game(total, games):
+    return float(np.round(total / games, 3)) if games else float('nan')
 
 
 class Team:
@@ -106,7 +268,7 @@ class Team:
         self.league = league
         self.name = name
         self.__match_data = []
-        self.__stats = []
+        self.__stats = None
         self._set_match_data()
         self.position = self._set_position()
         self.zone = self._set_zone()
@@ -116,13 +278,22 @@ class Team:
         self.opponent = opponent
         self.__stats.xGF = self.expected_scored()
 
+    @traced("Team._set_match_data")
     def _set_match_data(self):
-        connection = self.engine.connect()
-        sql_query = "SELECT * FROM {}".format(str("`" + self.name + " " + self.venue + "`"))
-        data = connection.execute(sql_query).fetchall()
-        connection.close()
-        match_columns = ['Date', 'Opponent', 'GF', 'GA', 'TG', 'W', 'D', 'L']
-        self.__match_data = pd.DataFrame(data, columns=match_columns)
+        league_data = self.league.team_match_data(self.name, self.venue)
+        if league_data is not None:
+            self.__match_data = league_data
+        else:
+            connection = self.engine.connect()
+            if self.league.layout == 'matches':
+                data = [row[2:] for row in read_matches(connection, team=self.name, venue=self.venue,
+                                                        since=self.league.since, until=self.league.until)]
+            else:
+                sql_query = "SELECT * FROM {}".format(str("`" + self.name + " " + self.venue + "`"))
+                data = connection.execute(sql_query).fetchall()
+            connection.close()
+            match_columns = ['Date', 'Opponent', 'GF', 'GA', 'TG', 'W', 'D', 'L']
+            self.__match_data = pd.DataFrame(data, columns=match_columns)
         self.set_stats()
 
     def get_match_data(self):
@@ -140,38 +311,21 @@ class Team:
 
         :return: -1 if instance in bottom 3; +1 if instance in top 3; +2 if instance in top 6; 0 otherwise
         """
-        if self.league.team_count:
-            difference = self.league.team_count - self.position
-            if difference <= 2:
-                return -1
-            elif difference >= self.league.team_count - 3:
-                return 1
-            elif difference >= self.league.team_count - 6:
-                return 2
-            else:
-                return 0
-        else:
-            return False
+        return self.league.zone(self.position)
 
     def set_stats(self):
-        stats_cols = ['GF', 'GA', 'TG', 'Games', 'aGF', 'aGA', 'aTG', 'O/U', 'W', 'D', 'L', 'ATT', 'DEF', 'xGF', 'xgs']
-        self.__stats = pd.DataFrame([[0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]],
-                                    columns=stats_cols)
-        self.__stats.Games = len(self.__match_data.Opponent.values)
+        stats = TeamStats()
+        stats.Games = len(self.__match_data.Opponent.values)
         for i in ['GF', 'GA', 'TG']:
-            self.__stats[i] = self.__match_data[i].values.sum()
-            self.__stats['a' + i] = round(self.__stats[i] / self.__stats.Games, 3)
+            setattr(stats, i, int(self.__match_data[i].values.sum()))
+            setattr(stats, 'a' + i, _per_game(getattr(stats, i), stats.Games))
         for i in ['W', 'D', 'L']:
-            self.__stats[i] = self.__match_data[i].values.sum()
-        self.__stats['O/U'] = (self.__match_data.TG > 2.5).sum()
-        if self.venue == 'HOME':
-            self.__stats.ATT = self.__stats.aGF.values[0] / self.league.get_home_stats().aGF.values[0]
-            self.__stats.DEF = self.__stats.aGA.values[0] / self.league.get_home_stats().aGA.values[0]
-        elif self.venue == 'AWAY':
-            self.__stats.ATT = self.__stats.aGF.values[0] / self.league.get_away_stats().aGF.values[0]
-            self.__stats.DEF = self.__stats.aGA.values[0] / self.league.get_away_stats().aGA.values[0]
-        self.__stats.ATT = round(self.__stats.ATT, 3)
-        self.__stats.DEF = round(self.__stats.DEF, 3)
+            setattr(stats, i, int(self.__match_data[i].values.sum()))
+        stats.OU = int((self.__match_data.TG.values > 2.5).sum())
+        league_stats = self.league.get_home_stats() if self.venue == 'HOME' else self.league.get_away_stats()
+        stats.ATT = float(np.round(stats.aGF / league_stats.aGF.values[0], 3))
+        stats.DEF = float(np.round(stats.aGA / league_stats.aGA.values[0], 3))
+        self.__stats = stats
 
     def get_stats(self):
         return self.__stats
@@ -179,54 +333,24 @@ class Team:
     def expected_scored(self):
         opp_def = self.opponent.get_stats().DEF
         if self.venue == 'HOME':
-            # print("\n" + self.name + " xGF")
-            self.__stats.xGF = round(self.__stats.ATT * opp_def * self.league.get_home_stats().aGF, 3)
-        elif self.venue == 'AWAY':
-            # print("\n" + self.name + " xGF")
-            self.__stats.xGF = round(self.__stats.ATT * opp_def * self.league.get_away_stats().aGF, 3)
-        return self.__stats.xGF.values[0]
+            league_gf = self.league.get_home_stats().aGF.values[0]
+        else:
+            league_gf = self.league.get_away_stats().aGF.values[0]
+        self.__stats.xGF = float(np.round(self.__stats.ATT * opp_def * league_gf, 3))
+        return self.__stats.xGF
 
     def plot_xgf(self):
-        fig, ax = plt.subplots(1, 1)
-        ax.set_title(self.name + " xGF", fontsize=20)
-        self._plot_helper(self.__stats.xGF, ax)
+        plot_goals(self.name + " xGF", self.__stats.xGF)
 
     def xgf(self):
-        # self.expected_scored(opponent)
-        x = np.linspace(0, math.ceil(self.__stats.xGF) + 5, math.ceil(self.__stats.xGF) + 6)
-        data = [round((math.pow(self.__stats.xGF, xi) * math.exp(-self.__stats.xGF)) / (math.factorial(xi)), 5) for xi
-                in x]
-
-        self.__stats.xgs = [data] * len(self.__stats)
-        return self.__stats.xgs.values[0]
+        self.__stats.xgs = list(goal_vector(self.__stats.xGF))
+        return self.__stats.xgs
 
     def display_name(self):
         print("\n\t\t\t*** {0} ({1}) ***\n".format(self.name, self.venue))
 
     def plot_gf(self):
-        fig, ax = plt.subplots(1, 1)
-        ax.set_title(self.name + " GF", fontsize=20)
-        self._plot_helper(self.__stats.aGF, ax)
+        plot_goals(self.name + " GF", self.__stats.aGF)
 
     def plot_ga(self):
-        fig, ax = plt.subplots(1, 1)
-        ax.set_title(self.name + " GA", fontsize=20)
-        self._plot_helper(self.__stats.aGA, ax)
-
-    @staticmethod
-    def _plot_helper(goals, ax):
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.grid(True)
-        ax.set_ylabel("Probability", fontsize=14)
-        ax.set_xlabel("Goals", fontsize=14)
-        ax.set_xlim([0, math.ceil(goals + 5)])
-        xs = np.linspace(gamma.ppf(0.0001, goals + 1), gamma.ppf(0.9999, goals + 1), 1000)
-        ax.plot(xs, gamma.pdf(xs, goals + 1), 'r-', lw=2, alpha=1)
-        x = np.linspace(0, math.ceil(goals) + 5, math.ceil(goals) + 6)
-        ax.bar(x, [round((math.pow(goals, xi) * math.exp(-goals)) / (math.factorial(xi)), 3) for xi in x], alpha=0.75,
-               align='edge')
-        ax.plot([goals, goals], [0, max(gamma.pdf(xs, goals + 1))], 'k--', lw=2,
-                label=r'$\mu$ = ' + str(goals.values[0]))
-        ax.legend(loc='upper right', framealpha=1, shadow=True, fontsize=14)
-        plt.show()
+        plot_goals(self.name + " GA", self.__stats.aGA)
@@ -1,40 +1,121 @@
+import argparse
 from db_connection import connect_to_db
-from classes import Team, League
+from classes import League
+from matches_table import uses_matches_table
+from ratings_cache import bump_version
+from sqlalchemy import text
 import pandas as pd
 
 pd.options.display.max_rows = 999
 pd.options.display.max_columns = 999
 
+TABLE_COLUMNS = ['team', 'mp', 'w', 'd', 'l', 'gf', 'ga', 'gd', 'points']
+
+# points deductions for the current season, only applied to the overall league table
+POINTS_DEDUCTIONS = {'league_one': {'Bolton Wanderers': -12}}
+
+
+def aggregate_tables(league, engine):
+    """
+    Computes the league, home and away tables with one GROUP BY over the league's match data, read from the matches
+    table if the schema has been migrated and from the UNION ALL of the team tables otherwise.
+
+    :param league: League instance
+    :param engine: engine connected to the league schema
+    :return: dictionary mapping table name to a dataframe with the columns of TABLE_COLUMNS
+    """
+    if uses_matches_table(engine):
+        source = "matches"
+    else:
+        source = "({}) AS m".format(league.team_tables_query())
+    sql = """
+        SELECT team, venue, COUNT(*) AS mp, SUM(win) AS w, SUM(draw) AS d, SUM(loss) AS l,
+               SUM(goals_for) AS gf, SUM(goals_against) AS ga
+        FROM {}
+        GROUP BY team, venue""".format(source)
+    connection = engine.connect()
+    data = connection.execute(text(sql)).fetchall()
+    connection.close()
+    totals = pd.DataFrame(data, columns=['team', 'venue', 'mp', 'w', 'd', 'l', 'gf', 'ga'])
+
+    tables = {}
+    for table_name, rows in [('home_league_table', totals[totals.venue == 'HOME']),
+                             ('away_league_table', totals[totals.venue == 'AWAY']),
+                             ('league_table', totals)]:
+        table = rows.groupby('team')[['mp', 'w', 'd', 'l', 'gf', 'ga']].sum()
+        table = table.reindex(league.teams, fill_value=0).astype(int)
+        table['gd'] = table.gf - table.ga
+        table['points'] = 3 * table.w + table.d
+        if table_name == 'league_table':
+            for team, deduction in POINTS_DEDUCTIONS.get(league.name, {}).items():
+                if team in table.index:
+                    table.loc[team, 'points'] += deduction
+        tables[table_name] = table.rename_axis('team').reset_index()[TABLE_COLUMNS]
+    return tables
+
+
+def replace_tables(tables, engine):
+    """
+    Replaces the contents of the league tables so that readers only ever see the old or the new tables. On MySQL each
+    table is rebuilt as a copy and swapped in with a single RENAME TABLE; other databases delete and insert inside
+    one transaction.
+
+    :param tables: dictionary mapping table name to a dataframe with the columns of TABLE_COLUMNS
+    :param engine: engine connected to the league schema
+    """
+    insert = "INSERT INTO {0} ({1}) VALUES ({2})"
+    columns = ", ".join(TABLE_COLUMNS)
+    values = ", ".join(":" + c for c in TABLE_COLUMNS)
+    connection = engine.connect()
+    try:
+        if engine.dialect.name == 'mysql':
+            renames = []
+            for name, table in tables.items():
+                connection.execute(text("DROP TABLE IF EXISTS {0}_rebuild, {0}_old".format(name)))
+                connection.execute(text("CREATE TABLE {0}_rebuild LIKE {0}".format(name)))
+                connection.execute(text(insert.format(name + "_rebuild", columns, values)), _records(table))
+                renames.append("{0} TO {0}_old, {0}_rebuild TO {0}".format(name))
+            connection.execute(text("RENAME TABLE " + ", ".join(renames)))
+            connection.execute(text("DROP TABLE " + ", ".join(name + "_old" for name in tables)))
+        else:
+            transaction = connection.begin()
+            try:
+                for name, table in tables.items():
+                    connection.execute(text("DELETE FROM {}".format(name)))
+                    connection.execute(text(insert.format(name, columns, values)), _records(table))
+                transaction.commit()
+            except Exception:
+                transaction.rollback()
+                raise
+    finally:
+        connection.close()
+
+
+def _records(df):
+    return [{key: (value if key == 'team' else int(value)) for key, value in record.items()}
+            for record in df.to_dict('records')]
+
 
 def main(league):
     """
-    Populates home and away league tables. Uses classes League() and Team().
+    Rebuilds the league, home and away tables of a league from its match data. Safe to rerun, e.g. after every
+    ingest.
 
-    :param league: league with home and away tables to be populated
+    :param league: league with tables to be rebuilt
     """
     engine = connect_to_db(league)
     if engine:
+        league_name = league
         league = League(league, engine)
-        for team in league.teams:
-            print()
-            for venue in ['HOME', 'AWAY']:
-                print(team, venue)
-                team_instance = Team(team, engine, league, venue)
-                stats = team_instance.get_stats()
-                cols = ['team', 'mp', 'w', 'd', 'l', 'gf', 'ga', 'gd', 'points']
-                df = pd.DataFrame([[team, stats.Games.values.sum(), stats.W.values.sum(), stats.D.values.sum(),
-                                    stats.L.values.sum(), stats.GF.values.sum(), stats.GA.values.sum(),
-                                    (stats.GF.values.sum() - stats.GA.values.sum()),
-                                    (3 * stats.W.values.sum() + stats.D.values.sum())]],
-                                  columns=cols)
-                print(df)
-                table_name = venue.lower() + "_league_table"
-                connection = engine.connect()
-                df.to_sql(con=connection, name=table_name, if_exists='append', index=False)
-                connection.close()
+        tables = aggregate_tables(league, engine)
+        replace_tables(tables, engine)
+        bump_version(league_name)
+        print("{}: rebuilt {}.".format(league_name, ", ".join(tables)))
 
 
 if __name__ == "__main__":
-    leagues = ['premier_league', 'championship', 'league_one', 'league_two']
-    for l in leagues:
+    parser = argparse.ArgumentParser(description="Rebuild league, home and away tables from the match data.")
+    parser.add_argument("leagues", nargs="*", default=['premier_league', 'championship', 'league_one', 'league_two'])
+    args = parser.parse_args()
+    for l in args.leagues:
         main(l)
@@ -1,18 +1,44 @@
+import os
+import threading
 import sqlalchemy as sqla
+from sqlalchemy import event
 from sshtunnel import SSHTunnelForwarder
+from tracing import traced
 
+VALID_SCHEMAS = ['premier_league', 'championship', 'league_one', 'league_two']
 
+# "mysql" goes through the SSH tunnel, "sqlite" uses one local file per schema (see sync_local.py)
+_backend = {"name": os.environ.get("FOOTBALL_DB_BACKEND", "mysql"),
+            "directory": os.environ.get("FOOTBALL_SQLITE_DIR", "local_db")}
+_credentials = None
+_engines = {}
+_registry_lock = threading.Lock()
+
+
+def read_auth():
+    """
+    Reads auth.txt once per process and returns its stripped lines.
+
+    :return: list of lines from auth.txt
+    """
+    global _credentials
+    if _credentials is None:
+        with open("auth.txt", "r") as file:
+            _credentials = [line.strip('\n') for line in file.readlines()]
+    return _credentials
+
+
+@traced("db.create_ssh_tunnel")
 def create_ssh_tunnel():
     print("Opening SSH Tunnel...")
-    with open("auth.txt", "r") as file:
-        text = file.readlines()
+    text = read_auth()
 
-    ec2_url = text[4].strip('\n')
-    ec2_port = text[5].strip('\n')
-    ec2_user = text[6].strip('\n')
-    ec2_key = text[7].strip('\n')
-    url = text[0].strip('\n')
-    port = text[2].strip('\n')
+    ec2_url = text[4]
+    ec2_port = text[5]
+    ec2_user = text[6]
+    ec2_key = text[7]
+    url = text[0]
+    port = text[2]
 
     server = SSHTunnelForwarder(
         (ec2_url, int(ec2_port)),
@@ -26,19 +52,111 @@ def create_ssh_tunnel():
     return server
 
 
-def connect_to_db(schema):
-    with open("auth.txt", "r") as file:
-        text = file.readlines()
-    user = text[1].strip('\n')
+def set_backend(name, directory=None):
+    """
+    Selects the database used by connect_to_db() for the rest of the process. Can also be set with the environment
+    variables FOOTBALL_DB_BACKEND and FOOTBALL_SQLITE_DIR.
+
+    :param name: "mysql" for the tunnelled schemas or "sqlite" for local files
+    :param directory: folder holding <schema>.db files when using sqlite
+    """
+    if name not in ["mysql", "sqlite"]:
+        raise ValueError("Unknown database backend {}".format(name))
+    dispose_engines()
+    with _registry_lock:
+        _backend["name"] = name
+        if directory:
+            _backend["directory"] = directory
+
+
+def get_backend():
+    return _backend["name"]
+
+
+def sqlite_path(schema, directory=None):
+    return os.path.join(directory or _backend["directory"], str(schema) + ".db")
+
+
+def _create_sqlite_engine(schema, path):
+    engine = sqla.create_engine("sqlite:///" + path, echo=False)
+
+    @event.listens_for(engine, "connect")
+    def attach_schema(dbapi_connection, connection_record):
+        # queries qualify tables with the schema name, e.g. `premier_league`.league_table, so the file is also
+        # attached under that name
+        dbapi_connection.execute("ATTACH DATABASE ? AS {}".format(schema), (path,))
+
+    return engine
+
+
+@traced("db.connect_to_db")
+def connect_to_db(schema, pool_size=5, max_overflow=10, pool_recycle=3600, backend=None):
+    """
+    Returns the pooled engine for a schema, creating it on first use. Engines are shared across the process so
+    repeated calls reuse warm connections instead of opening new ones through the tunnel.
+
+    :param schema: name of league schema
+    :param pool_size: connections kept open in the pool (only used when the engine is first created)
+    :param max_overflow: extra connections allowed above pool_size (only used when the engine is first created)
+    :param pool_recycle: seconds after which a pooled connection is replaced (only used when the engine is first
+                         created)
+    :param backend: "mysql" or "sqlite", defaults to the backend chosen with set_backend()
+    :return: engine, or False if the schema is not a valid league
+    """
     dbname = str(schema)
-    password = text[3].strip('\n')
-    if dbname in ['premier_league', 'championship', 'league_one','league_two']:
-        eng = "mysql+pymysql://{0}:{1}@{2}:{3}/{4}".format(user, password, '', 1111, dbname)
-        engine = sqla.create_engine(eng, echo=False)
-        return engine
-    else:
+    if dbname not in VALID_SCHEMAS:
         print("Invalid league entered!")
         return False
+    with _registry_lock:
+        backend = backend or _backend["name"]
+        key = (backend, dbname)
+        if key not in _engines:
+            if backend == "sqlite":
+                path = sqlite_path(dbname)
+                if not os.path.exists(path):
+                    print("No local copy of {} found at {}, run sync_local.py first.".format(dbname, path))
+                    return False
+                _engines[key] = _create_sqlite_engine(dbname, path)
+            else:
+                text = read_auth()
+                user = text[1]
+                password = text[3]
+                eng = "mysql+pymysql://{0}:{1}@{2}:{3}/{4}".format(user, password, '', 1111, dbname)
+                _engines[key] = sqla.create_engine(eng, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+                                                   pool_recycle=pool_recycle, pool_pre_ping=True)
+        return _engines[key]
+
+
+def pool_status():
+    """
+    Connection pool statistics for every engine created so far.
+
+    :return: dictionary mapping (backend, schema) to a dictionary with keys size, checked_in, checked_out and
+             overflow. Pools that don't keep connections, e.g. for SQLite files, report None for each key.
+    """
+    with _registry_lock:
+        engines = dict(_engines)
+    status = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        status[key] = {stat: (getattr(pool, method)() if hasattr(pool, method) else None)
+                       for stat, method in [("size", "size"), ("checked_in", "checkedin"),
+                                            ("checked_out", "checkedout"), ("overflow", "overflow")]}
+    return status
+
+
+def dispose_engines(backend=None, schema=None):
+    """
+    Closes pooled connections and removes their engines from the registry, e.g. after the SSH tunnel has been
+    restarted or a local file has been replaced.
+
+    :param backend: only dispose engines of this backend
+    :param schema: only dispose engines of this schema
+    """
+    with _registry_lock:
+        for key in list(_engines):
+            if backend in (None, key[0]) and schema in (None, key[1]):
+                _engines.pop(key).dispose()
 
 
 if __name__ == '__main__':
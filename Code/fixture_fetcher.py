@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http_cache import get_text
+
+FIXTURE_URLS = {"premier_league":
+                "https://ie.soccerway.com/national/england/premier-league/20192020/regular-season/r53145/matches/",
+                "championship":
+                "https://ie.soccerway.com/national/england/championship/20192020/regular-season/r53782/matches/",
+                "league_one":
+                "https://ie.soccerway.com/national/england/league-one/20192020/regular-season/r53677/matches/",
+                "league_two":
+                "https://ie.soccerway.com/national/england/league-two/20192020/regular-season/r53874/matches/"}
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 30)
+MAX_PER_HOST = 4
+# seconds a season page is reused before it is revalidated
+FIXTURE_TTL = 600
+RETRIES = 3
+
+_session = None
+_host_limits = {}
+_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Process-wide requests session with a connection pool per host and retries with backoff on connection errors
+    and 429/5xx responses.
+
+    :return: requests.Session
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            retry = Retry(total=RETRIES, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=len(FIXTURE_URLS), pool_maxsize=MAX_PER_HOST, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _host_limit(url):
+    host = urlparse(url).netloc
+    with _lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_limits[host]
+
+
+def fetch(url, timeout=TIMEOUT):
+    """
+    Fetches a page over the shared session, with at most MAX_PER_HOST requests in flight to the same host. Pages
+    go through http_cache, so a page fetched in the last FIXTURE_TTL seconds costs nothing and an older one is
+    revalidated.
+
+    :param url: page to fetch
+    :param timeout: (connect, read) timeout in seconds
+    :return: page text
+    """
+    with _host_limit(url):
+        return get_text(url, ttl=FIXTURE_TTL, session=get_session(), timeout=timeout)
+
+
+def fetch_all(urls, max_workers=None, timeout=TIMEOUT):
+    """
+    Fetches several pages in parallel, so the total time is close to that of the slowest page.
+
+    :param urls: pages to fetch
+    :param max_workers: number of threads, defaults to one per page
+    :param timeout: (connect, read) timeout in seconds for each page
+    :return: dictionary mapping url to page text, or to the exception raised while fetching it
+    """
+    urls = list(urls)
+    pages = {}
+    if not urls:
+        return pages
+    with ThreadPoolExecutor(max_workers=max_workers or len(urls)) as executor:
+        futures = {url: executor.submit(fetch, url, timeout) for url in urls}
+        for url, future in futures.items():
+            try:
+                pages[url] = future.result()
+            except Exception as e:
+                pages[url] = e
+    return pages
+
+
+def fetch_fixture_pages(leagues=None):
+    """
+    Fetches the soccerway season pages of several leagues in parallel.
+
+    :param leagues: league schema names, defaults to all four leagues
+    :return: dictionary mapping league to page text, or to the exception raised while fetching it
+    """
+    leagues = list(leagues or FIXTURE_URLS.keys())
+    pages = fetch_all(FIXTURE_URLS[league] for league in leagues)
+    return {league: pages[FIXTURE_URLS[league]] for league in leagues}
@@ -0,0 +1,64 @@
+from collections import namedtuple
+from datetime import datetime
+import lxml.html
+
+Fixture = namedtuple("Fixture", ["date", "home", "away", "status"])
+
+# soccerway shows dates as DD/MM/YY
+DATE_FORMAT = "%d/%m/%y"
+
+
+def parse_date(text):
+    """
+    Converts a soccerway date to a datetime.date, returning the stripped text unchanged if it isn't in DATE_FORMAT.
+
+    :param text: date text, or a datetime.date
+    :return: datetime.date or string
+    """
+    if not isinstance(text, str):
+        return text
+    text = text.strip()
+    try:
+        return datetime.strptime(text, DATE_FORMAT).date()
+    except ValueError:
+        return text
+
+
+def _link(cell):
+    links = cell.findall(".//a")
+    return links[0] if links else None
+
+
+def parse_fixtures(page, date=None):
+    """
+    Extracts every fixture from a soccerway season page, walking the rows of the match tables once.
+
+    :param page: page text
+    :param date: only keep fixtures on this date (DD/MM/YY text or datetime.date), or None for all
+    :return: list of Fixture(date, home, away, status) where status is the text of the score/time cell, "-" for
+             postponed games
+    """
+    if date is not None:
+        date = parse_date(date)
+    document = lxml.html.fromstring(page)
+    fixtures = []
+    current_date = None
+    for row in document.iter("tr"):
+        home = away = status = None
+        for cell in row.iterchildren("td"):
+            classes = (cell.get("class") or "").split()
+            if "date" in classes:
+                # rows after the first of a day may leave the date cell empty
+                current_date = parse_date(cell.text_content()) or current_date
+            elif "team-a" in classes:
+                link = _link(cell)
+                home = link.get("title") if link is not None else cell.text_content().strip()
+            elif "team-b" in classes:
+                link = _link(cell)
+                away = link.get("title") if link is not None else cell.text_content().strip()
+            elif "score-time" in classes:
+                link = _link(cell)
+                status = (link if link is not None else cell).text_content().strip()
+        if home and away and (date is None or current_date == date):
+            fixtures.append(Fixture(current_date, home, away, status))
+    return fixtures
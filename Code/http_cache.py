@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import requests
+
+# the cache lives in FOOTBALL_HTTP_CACHE; with FOOTBALL_HTTP_OFFLINE=1 only cached responses are served
+_settings = {"directory": os.environ.get("FOOTBALL_HTTP_CACHE", "http_cache"),
+             "offline": os.environ.get("FOOTBALL_HTTP_OFFLINE", "") not in ("", "0")}
+
+DEFAULT_TTL = 300
+
+_default_session = requests.Session()
+
+
+class OfflineCacheMiss(Exception):
+    pass
+
+
+def configure(directory=None, offline=None):
+    """
+    Changes where responses are cached and whether the network may be used.
+
+    :param directory: cache folder
+    :param offline: if True, only serve recorded responses and raise OfflineCacheMiss for anything else
+    """
+    if directory is not None:
+        _settings["directory"] = directory
+    if offline is not None:
+        _settings["offline"] = offline
+
+
+def _paths(url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    base = os.path.join(_settings["directory"], key)
+    return base + ".json", base + ".body"
+
+
+def _write(path, data):
+    # a temp file of its own for every write, so threads storing the same url don't replace each other's file
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def load(url):
+    """
+    Cached response for a url.
+
+    :param url: requested url
+    :return: (metadata dictionary, body bytes), or (None, None) if the url has not been cached
+    """
+    meta_path, body_path = _paths(url)
+    try:
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+        with open(body_path, "rb") as file:
+            body = file.read()
+    except (IOError, ValueError):
+        return None, None
+    return meta, body
+
+
+def store(url, content, headers=None, encoding=None):
+    """
+    Records a response in the cache, e.g. a page saved earlier so that it can be replayed offline.
+
+    :param url: url the response belongs to
+    :param content: body bytes
+    :param headers: response headers, used for the ETag and Last-Modified validators
+    :param encoding: text encoding of the body
+    """
+    headers = headers or {}
+    os.makedirs(_settings["directory"], exist_ok=True)
+    meta = {"url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "encoding": encoding,
+            "fetched_at": time.time()}
+    meta_path, body_path = _paths(url)
+    _write(body_path, content)
+    _write(meta_path, json.dumps(meta).encode("utf-8"))
+
+
+def _touch(url, meta):
+    meta["fetched_at"] = time.time()
+    _write(_paths(url)[0], json.dumps(meta).encode("utf-8"))
+
+
+def get(url, ttl=DEFAULT_TTL, session=None, timeout=None):
+    """
+    Fetches a url through the cache. A response younger than ttl is returned without a request; an older one is
+    revalidated with If-None-Match / If-Modified-Since so an unchanged resource only costs a 304.
+
+    :param url: url to fetch
+    :param ttl: seconds a cached response is used without revalidating
+    :param session: requests session to use, defaults to a shared session
+    :param timeout: request timeout in seconds
+    :return: (body bytes, encoding)
+    """
+    meta, body = load(url)
+    if _settings["offline"]:
+        if body is None:
+            raise OfflineCacheMiss("No recorded response for {}".format(url))
+        return body, meta.get("encoding")
+    if body is not None and time.time() - meta["fetched_at"] < ttl:
+        return body, meta.get("encoding")
+
+    headers = {}
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    response = (session or _default_session).get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and body is not None:
+        _touch(url, meta)
+        return body, meta.get("encoding")
+    response.raise_for_status()
+    encoding = response.encoding or response.apparent_encoding
+    store(url, response.content, response.headers, encoding)
+    return response.content, encoding
+
+
+def get_text(url, ttl=DEFAULT_TTL, session=None, timeout=None):
+    """
+    Same as get(), decoded to text.
+    """
+    body, encoding = get(url, ttl, session, timeout)
+    return body.decode(encoding or "utf-8", errors="replace")
+
+
+def get_content(url, ttl=DEFAULT_TTL, session=None, timeout=None):
+    """
+    Same as get(), as raw bytes, e.g. for feedparser which reads the encoding from the document itself.
+    """
+    return get(url, ttl, session, timeout)[0]
@@ -0,0 +1,84 @@
+import argparse
+import pandas as pd
+from db_connection import connect_to_db
+from classes import League
+from matches_table import DATE_FORMAT
+from write_results import MATCH_COLUMNS, ingest
+
+
+def read_chunks(path, chunk_size):
+    """
+    Streams matches from a CSV or JSON-lines file without loading the whole file.
+
+    :param path: .csv, .json or .jsonl file with the columns date, home_team, away_team, home_goals, away_goals
+    :param chunk_size: number of matches per chunk
+    :return: generator of dataframes
+    """
+    if path.lower().endswith(".csv"):
+        reader = pd.read_csv(path, chunksize=chunk_size, dtype={"date": str})
+    elif path.lower().endswith((".json", ".jsonl")):
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, dtype={"date": str}, convert_dates=False)
+    else:
+        raise ValueError("Unsupported file type for {}, expected .csv, .json or .jsonl".format(path))
+    for chunk in reader:
+        missing = [c for c in MATCH_COLUMNS if c not in chunk.columns]
+        if missing:
+            raise ValueError("{} is missing the column(s) {}".format(path, missing))
+        yield chunk[MATCH_COLUMNS]
+
+
+def validate(chunk, teams, dayfirst=False):
+    """
+    Drops and reports matches with unknown teams, a team playing itself, a missing score or a date that can't be
+    read. Dates are rewritten in DATE_FORMAT, as stored by the feed ingest, so that a match is recognised as already
+    written whatever format the file uses.
+
+    :param chunk: dataframe of matches
+    :param teams: valid team names for the league
+    :param dayfirst: read ambiguous dates such as 03/04/2020 as DD/MM/YYYY
+    :return: dataframe of valid matches with integer goals and normalised dates
+    """
+    goals = chunk[["home_goals", "away_goals"]].apply(pd.to_numeric, errors="coerce")
+    dates = pd.to_datetime(chunk.date, errors="coerce", dayfirst=dayfirst)
+    valid = (chunk.home_team.isin(teams) & chunk.away_team.isin(teams) & (chunk.home_team != chunk.away_team) &
+             goals.notnull().all(axis=1) & dates.notnull())
+    for row in chunk[~valid].itertuples(index=False):
+        print("Skipping invalid match:", row.date, row.home_team, row.home_goals, "-", row.away_goals, row.away_team)
+    chunk = chunk[valid].assign(date=dates[valid].dt.strftime(DATE_FORMAT),
+                                home_goals=goals.home_goals[valid].astype(int),
+                                away_goals=goals.away_goals[valid].astype(int))
+    return chunk
+
+
+def import_files(schema, paths, chunk_size=5000, dayfirst=False):
+    """
+    Imports results from files into a league, one transaction per chunk. Matches already written are skipped, so an
+    interrupted import can simply be run again.
+
+    :param schema: name of league schema
+    :param paths: list of CSV or JSON-lines files
+    :param chunk_size: number of matches written per transaction
+    :param dayfirst: read ambiguous dates as DD/MM/YYYY
+    :return: number of matches written
+    """
+    engine = connect_to_db(schema)
+    if not engine:
+        return 0
+    teams = League(schema, engine).team_list()
+    written = 0
+    for path in paths:
+        for chunk in read_chunks(path, chunk_size):
+            written += ingest(validate(chunk, teams, dayfirst), schema, engine)
+        print("{}: {} match(es) written so far.".format(path, written))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import historical results from CSV or JSON-lines files.")
+    parser.add_argument("league", choices=["premier_league", "championship", "league_one", "league_two"])
+    parser.add_argument("files", nargs="+", help="files with the columns " + ", ".join(MATCH_COLUMNS))
+    parser.add_argument("--chunk-size", type=int, default=5000, help="matches written per transaction")
+    parser.add_argument("--dayfirst", action="store_true", help="dates are in DD/MM/YYYY format")
+    args = parser.parse_args()
+    total = import_files(args.league, args.files, args.chunk_size, args.dayfirst)
+    print("\nComplete! Wrote {} match(es).".format(total))
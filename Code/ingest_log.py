@@ -0,0 +1,125 @@
+import threading
+import pandas as pd
+from sqlalchemy import Table, Column, MetaData, VARCHAR, text
+
+metadata = MetaData()
+
+ingested_matches = Table("ingested_matches", metadata,
+                         Column("date", VARCHAR(45), primary_key=True),
+                         Column("home_team", VARCHAR(45), primary_key=True),
+                         Column("away_team", VARCHAR(45), primary_key=True))
+
+_known = {}
+_high_water = {}
+_lock = threading.Lock()
+
+
+def _key(date, home_team, away_team):
+    return str(date), str(home_team), str(away_team)
+
+
+def _seed(schema, connection):
+    """
+    Fills a new ingest log with the matches already in the team tables, read from each team's HOME table in one
+    query, so that data written before the log existed is not ingested again.
+    """
+    from classes import League
+    league = League(schema, connection)
+    if not league.name:
+        return []
+    data = league.load_match_data(connection)
+    home = data[data.Venue == 'HOME']
+    keys = [_key(date, team, opponent) for date, team, opponent in zip(home.Date, home.Team, home.Opponent)]
+    if keys:
+        connection.execute(ingested_matches.insert(),
+                           [{"date": d, "home_team": h, "away_team": a} for d, h, a in keys])
+    return keys
+
+
+def _load(schema, engine):
+    if schema in _known:
+        return _known[schema]
+    connection = engine.connect()
+    transaction = connection.begin()
+    try:
+        if not engine.dialect.has_table(connection, ingested_matches.name):
+            ingested_matches.create(bind=connection)
+            keys = _seed(schema, connection)
+        else:
+            keys = [_key(*row) for row in connection.execute(text(
+                "SELECT date, home_team, away_team FROM ingested_matches")).fetchall()]
+        transaction.commit()
+    except Exception:
+        transaction.rollback()
+        raise
+    finally:
+        connection.close()
+    _known[schema] = set(keys)
+    _update_high_water(schema, [k[0] for k in keys])
+    return _known[schema]
+
+
+def _update_high_water(schema, dates):
+    dates = pd.to_datetime(pd.Series(dates, dtype=object), errors='coerce').dropna()
+    if not dates.empty:
+        latest = dates.max()
+        if schema not in _high_water or latest > _high_water[schema]:
+            _high_water[schema] = latest
+
+
+def high_water_mark(schema, engine):
+    """
+    Date of the latest match already ingested for a league.
+
+    :param schema: name of league schema
+    :param engine: engine connected to the league schema
+    :return: pandas Timestamp, or None if nothing has been ingested
+    """
+    with _lock:
+        _load(schema, engine)
+        return _high_water.get(schema)
+
+
+def filter_new(schema, matches, engine):
+    """
+    Drops matches that have already been ingested, or that appear twice in matches, without touching the team or
+    league tables. The ingest log is read from the database once per process and kept in memory after that.
+
+    :param schema: name of league schema
+    :param matches: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    :param engine: engine connected to the league schema
+    :return: dataframe of matches not yet ingested
+    """
+    with _lock:
+        known = _load(schema, engine)
+    keys = [_key(*k) for k in zip(matches.date, matches.home_team, matches.away_team)]
+    is_new = [k not in known for k in keys]
+    new_matches = matches[is_new]
+    return new_matches[~new_matches.duplicated(subset=["date", "home_team", "away_team"])]
+
+
+def log_matches(connection, matches):
+    """
+    Adds matches to the ingest log using an open connection, so that it can share a transaction with the writes of
+    the same matches. Call remember() once the transaction has committed.
+
+    :param connection: open connection to the league schema
+    :param matches: dataframe with columns date, home_team, away_team
+    """
+    records = [{"date": d, "home_team": h, "away_team": a} for d, h, a in
+               {_key(*k) for k in zip(matches.date, matches.home_team, matches.away_team)}]
+    if records:
+        connection.execute(ingested_matches.insert(), records)
+
+
+def remember(schema, matches):
+    """
+    Adds committed matches to the in-memory copy of a league's ingest log.
+
+    :param schema: name of league schema
+    :param matches: dataframe with columns date, home_team, away_team
+    """
+    with _lock:
+        if schema in _known:
+            _known[schema].update(_key(*k) for k in zip(matches.date, matches.home_team, matches.away_team))
+            _update_high_water(schema, list(matches.date))
@@ -1,4 +1,5 @@
 from db_connection import connect_to_db
+from write_results import ingest
 from sqlalchemy import exc
 import pandas as pd
 import numpy as np
@@ -248,8 +249,15 @@ def manual_write():
         [team_df, team_identifier, away_df, opponent_identifier] = get_match_data(team, league_dict, league)
         is_sure = str(input("Is this correct? \"Y\" to continue. "))
         if is_sure.lower() == "y":
-            add_to_db(team_df, team_identifier, engine)
-            add_to_db(away_df, opponent_identifier, engine)
+            match = pd.DataFrame({"date": team_df.date, "home_team": team, "away_team": team_df.opponent,
+                                  "home_goals": team_df.goals_for.astype(int),
+                                  "away_goals": team_df.goals_against.astype(int)})
+            # written like a feed result, so the matches table, league tables, ingest log and data version are
+            # updated in the same transaction as the team tables
+            if not ingest(match, schema, engine):
+                print("This match has already been written!")
+            else:
+                print("Added data to tables {} and {}!".format(team_identifier, opponent_identifier))
         else:
             print("You have quit.")
         temp = str(
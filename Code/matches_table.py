@@ -0,0 +1,149 @@
+import argparse
+import pandas as pd
+from sqlalchemy import Table, Column, MetaData, Index, VARCHAR, Integer, Date, text
+from db_connection import connect_to_db
+
+metadata = MetaData()
+
+# one row per team per match, so a fixture appears once with venue HOME and once with venue AWAY
+matches = Table("matches", metadata,
+                Column("team", VARCHAR(45), primary_key=True),
+                Column("venue", VARCHAR(4), primary_key=True),
+                Column("match_date", Date, primary_key=True),
+                Column("opponent", VARCHAR(45), nullable=False),
+                Column("goals_for", Integer, nullable=False),
+                Column("goals_against", Integer, nullable=False),
+                Column("total_goals", Integer, nullable=False),
+                Column("win", Integer, nullable=False),
+                Column("draw", Integer, nullable=False),
+                Column("loss", Integer, nullable=False),
+                Index("ix_matches_venue_date", "venue", "match_date"),
+                Index("ix_matches_date", "match_date"))
+
+# how dates are stored in the team tables and the ingest log, as written by the feed ingest
+DATE_FORMAT = "%m/%d/%Y"
+
+MATCH_COLUMNS = ["team", "venue", "match_date", "opponent", "goals_for", "goals_against", "total_goals", "win",
+                 "draw", "loss"]
+
+
+def uses_matches_table(engine):
+    """
+    Whether a schema has been migrated to the matches table. Checked on every call, so that a migration made while
+    a service is running is picked up.
+
+    :param engine: engine connected to a league schema
+    :return: boolean
+    """
+    connection = engine.connect()
+    try:
+        return engine.dialect.has_table(connection, matches.name)
+    finally:
+        connection.close()
+
+
+def parse_dates(dates):
+    """
+    Converts the VARCHAR dates of the team tables (MM/DD/YYYY) to dates, leaving NaT where a date can't be parsed.
+
+    :param dates: sequence of date strings
+    :return: pandas Series of datetime.date or NaT
+    """
+    parsed = pd.to_datetime(pd.Series(dates, dtype=object), format=DATE_FORMAT, errors="coerce")
+    missing = parsed.isnull()
+    if missing.any():
+        # fall back to pandas' parser for anything not in the usual format, e.g. dates taken straight from a feed
+        parsed[missing] = pd.to_datetime(pd.Series(dates, dtype=object)[missing], errors="coerce")
+    return parsed.dt.date
+
+
+def match_records(rows):
+    """
+    Team rows as produced by write_results.team_rows() in the layout of the matches table.
+
+    :param rows: dataframe with columns team, venue, date, opponent, goals_for, goals_against, total_goals, win,
+                 draw, loss
+    :return: list of dictionaries ready for executemany
+    """
+    rows = rows.rename(columns={"date": "match_date"}).assign(match_date=parse_dates(rows.date).values)
+    records = []
+    for record in rows[MATCH_COLUMNS].to_dict("records"):
+        records.append({key: (value if key in ("team", "venue", "match_date", "opponent") else int(value))
+                        for key, value in record.items()})
+    return records
+
+
+def migrate(schema, engine=None, chunk_size=5000):
+    """
+    Creates the matches table for a schema if needed and copies every team's HOME and AWAY table into it, read with
+    one League.load_match_data() query. The copy replaces the contents of the matches table in a single
+    transaction, so the migration can be rerun at any time.
+
+    :param schema: name of league schema
+    :param engine: engine connected to the schema, defaults to connect_to_db(schema)
+    :param chunk_size: rows per INSERT batch
+    :return: number of rows copied
+    """
+    from classes import League
+    from write_results import TEAM_COLUMNS
+
+    engine = engine or connect_to_db(schema)
+    league = League(schema, engine)
+    data = league.load_match_data(engine)
+    rows = data.copy()
+    rows.columns = ["team", "venue"] + TEAM_COLUMNS
+    records = match_records(rows)
+    valid = [r for r in records if not pd.isnull(r["match_date"])]
+    for r in records:
+        if pd.isnull(r["match_date"]):
+            print("Skipping row with an unreadable date:", r["team"], r["venue"], r["opponent"])
+
+    matches.create(bind=engine, checkfirst=True)
+    connection = engine.connect()
+    transaction = connection.begin()
+    try:
+        connection.execute(matches.delete())
+        for start in range(0, len(valid), chunk_size):
+            connection.execute(matches.insert(), valid[start:start + chunk_size])
+        transaction.commit()
+    except Exception:
+        transaction.rollback()
+        raise
+    finally:
+        connection.close()
+    print("{}: copied {} row(s) into matches.".format(schema, len(valid)))
+    return len(valid)
+
+
+def read_matches(connection, team=None, venue=None, since=None, until=None):
+    """
+    Reads rows from the matches table, restricted by team, venue and date so that the composite index is used.
+
+    :param connection: open connection or engine for the schema
+    :param team: team name, or None for every team
+    :param venue: 'HOME' or 'AWAY', or None for both
+    :param since: earliest match date to include, or None
+    :param until: latest match date to include, or None
+    :return: list of rows in the order of MATCH_COLUMNS
+    """
+    conditions = []
+    params = {}
+    for column, operator, value in [("team", "=", team), ("venue", "=", venue), ("match_date", ">=", since),
+                                    ("match_date", "<=", until)]:
+        if value is not None:
+            name = column + ("_from" if operator == ">=" else "_to" if operator == "<=" else "")
+            conditions.append("{0} {1} :{2}".format(column, operator, name))
+            params[name] = value
+    sql = "SELECT {0} FROM matches".format(", ".join(MATCH_COLUMNS))
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY team, venue, match_date"
+    return connection.execute(text(sql), params).fetchall()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the per-team HOME/AWAY tables into the matches table.")
+    parser.add_argument("leagues", nargs="*", default=["premier_league", "championship", "league_one", "league_two"])
+    args = parser.parse_args()
+    for league_name in args.leagues:
+        migrate(league_name)
@@ -0,0 +1,42 @@
+import math
+import numpy as np
+
+# matplotlib and scipy are only imported when something is plotted, so that the mail service, ingest scripts and
+# anything else importing classes start without loading a display backend
+
+
+def goal_distribution(goals, ax):
+    """
+    Draws the Poisson distribution of goals for a given average, with its conjugate gamma density over the top.
+
+    :param goals: average goals
+    :param ax: matplotlib axes to draw on
+    """
+    from scipy.stats import gamma
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    ax.grid(True)
+    ax.set_ylabel("Probability", fontsize=14)
+    ax.set_xlabel("Goals", fontsize=14)
+    ax.set_xlim([0, math.ceil(goals + 5)])
+    xs = np.linspace(gamma.ppf(0.0001, goals + 1), gamma.ppf(0.9999, goals + 1), 1000)
+    ax.plot(xs, gamma.pdf(xs, goals + 1), 'r-', lw=2, alpha=1)
+    x = np.linspace(0, math.ceil(goals) + 5, math.ceil(goals) + 6)
+    ax.bar(x, [round((math.pow(goals, xi) * math.exp(-goals)) / math.factorial(int(xi)), 3) for xi in x], alpha=0.75,
+           align='edge')
+    ax.plot([goals, goals], [0, max(gamma.pdf(xs, goals + 1))], 'k--', lw=2, label=r'$\mu$ = ' + str(goals))
+    ax.legend(loc='upper right', framealpha=1, shadow=True, fontsize=14)
+
+
+def plot_goals(title, goals):
+    """
+    Shows goal_distribution() in a new figure.
+
+    :param title: figure title, e.g. "Arsenal GF"
+    :param goals: average goals
+    """
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(1, 1)
+    ax.set_title(title, fontsize=20)
+    goal_distribution(goals, ax)
+    plt.show()
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from ratings_cache import get_version
+
+MAX_ENTRIES = 1024
+# seconds a prediction is served before it is recomputed, even if the league's data hasn't changed
+TTL = 3600
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0}
+
+
+def get_prediction(league, home, away, compute, ttl=TTL):
+    """
+    Prediction for a fixture, computed once per version of the league's data. Writes to a league bump its version
+    (see ratings_cache.bump_version()), so cached predictions are never served after new results are ingested.
+
+    :param league: name of league schema
+    :param home: home team name
+    :param away: away team name
+    :param compute: function called without arguments to compute the prediction on a miss
+    :param ttl: seconds an entry may be served for
+    :return: copy of the cached results dictionary
+    """
+    key = (league, home, away, get_version(league))
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and now - entry[0] < ttl:
+            _cache.move_to_end(key)
+            _counters["hits"] += 1
+            return dict(entry[1])
+        _counters["misses"] += 1
+
+    # computed outside the lock so a rebuild of one league's ratings doesn't hold up hits for other fixtures
+    result = compute()
+    if result is None:
+        return None
+    with _lock:
+        _cache[key] = (now, dict(result))
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return dict(result)
+
+
+def stats():
+    """
+    Hit and miss counts since the cache was last cleared.
+
+    :return: dictionary with keys "hits", "misses", "entries" and "hit rate"
+    """
+    with _lock:
+        lookups = _counters["hits"] + _counters["misses"]
+        return {"hits": _counters["hits"],
+                "misses": _counters["misses"],
+                "entries": len(_cache),
+                "hit rate": round(_counters["hits"] / lookups, 3) if lookups else 0.0}
+
+
+def clear(league=None):
+    """
+    Drops cached predictions and resets the counters.
+
+    :param league: name of league schema, or None to drop every league
+    """
+    with _lock:
+        for key in list(_cache):
+            if league is None or key[0] == league:
+                del _cache[key]
+        if league is None:
+            _counters["hits"] = 0
+            _counters["misses"] = 0
@@ -0,0 +1,209 @@
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from db_connection import connect_to_db
+from ratings_cache import get_version
+
+MAX_ITERATIONS = 500
+TOLERANCE = 1e-9
+
+_fits = {}
+_lock = threading.Lock()
+
+
+def negative_log_likelihood(params, home, away, home_goals, away_goals, team_count):
+    """
+    Poisson negative log-likelihood of every match and its gradient, for the model
+        home goals ~ Poisson(exp(mu + home advantage + attack[home] + defence[away]))
+        away goals ~ Poisson(exp(mu + attack[away] + defence[home]))
+    Attack and defence are centred on zero so that the model is identifiable. The log(goals!) term is constant and
+    left out.
+
+    :param params: array of mu, home advantage, team_count raw attack values and team_count raw defence values
+    :param home: index of the home team of each match
+    :param away: index of the away team of each match
+    :param home_goals: goals scored by the home team of each match
+    :param away_goals: goals scored by the away team of each match
+    :param team_count: number of teams
+    :return: (negative log-likelihood, gradient with respect to params)
+    """
+    mu, advantage = params[0], params[1]
+    attack = params[2:2 + team_count]
+    defence = params[2 + team_count:]
+    attack = attack - attack.mean()
+    defence = defence - defence.mean()
+    home_log = mu + advantage + attack[home] + defence[away]
+    away_log = mu + attack[away] + defence[home]
+    home_rate = np.exp(home_log)
+    away_rate = np.exp(away_log)
+    value = (home_rate - home_goals * home_log).sum() + (away_rate - away_goals * away_log).sum()
+
+    home_residual = home_rate - home_goals
+    away_residual = away_rate - away_goals
+    attack_gradient = (np.bincount(home, home_residual, team_count) +
+                       np.bincount(away, away_residual, team_count))
+    defence_gradient = (np.bincount(away, home_residual, team_count) +
+                        np.bincount(home, away_residual, team_count))
+    gradient = np.concatenate([[home_residual.sum() + away_residual.sum(), home_residual.sum()],
+                               attack_gradient - attack_gradient.mean(),
+                               defence_gradient - defence_gradient.mean()])
+    return value, gradient
+
+
+class RatingFit:
+    def __init__(self, teams, params, matches, iterations, log_likelihood):
+        """
+        Fitted attack, defence and home advantage of a league.
+
+        :param teams: team names, in the order of the attack and defence parameters
+        :param params: solution as taken by negative_log_likelihood()
+        :param matches: dataframe of the matches fitted, columns date, home_team, away_team, home_goals, away_goals
+        :param iterations: optimiser iterations used
+        :param log_likelihood: log-likelihood at the solution, without the constant term
+        """
+        self.teams = list(teams)
+        self.params = params
+        self.matches = matches
+        self.iterations = iterations
+        self.log_likelihood = log_likelihood
+        team_count = len(self.teams)
+        self.mu = params[0]
+        self.home_advantage = params[1]
+        self.attack = pd.Series(params[2:2 + team_count] - params[2:2 + team_count].mean(), index=self.teams)
+        self.defence = pd.Series(params[2 + team_count:] - params[2 + team_count:].mean(), index=self.teams)
+
+    def expected_goals(self, home_team, away_team):
+        """
+        :param home_team: home team name
+        :param away_team: away team name
+        :return: (home expected goals, away expected goals)
+        """
+        home_xg = np.exp(self.mu + self.home_advantage + self.attack[home_team] + self.defence[away_team])
+        away_xg = np.exp(self.mu + self.attack[away_team] + self.defence[home_team])
+        return round(home_xg, 3), round(away_xg, 3)
+
+    def ratings(self):
+        """
+        Ratings in the layout of League.ratings(), so they can be passed to League.matchup_matrix(). The model has no
+        separate home and away strength, so both venues get the same multiplicative attack and defence.
+
+        :return: DataFrame indexed by team with columns home_att, home_def, away_att, away_def
+        """
+        attack = np.exp(self.attack).round(3)
+        defence = np.exp(self.defence).round(3)
+        return pd.DataFrame({"home_att": attack, "home_def": defence, "away_att": attack, "away_def": defence},
+                            index=pd.Index(self.teams, name='Team'),
+                            columns=['home_att', 'home_def', 'away_att', 'away_def'])
+
+    def average_goals(self):
+        """
+        Goals expected from an average team at home and away, the counterparts of League.get_home_stats().aGF and
+        League.get_away_stats().aGF in this model.
+
+        :return: (home, away)
+        """
+        return round(np.exp(self.mu + self.home_advantage), 3), round(np.exp(self.mu), 3)
+
+
+def _starting_point(teams, matches, previous):
+    team_count = len(teams)
+    if previous is not None:
+        index = {team: i for i, team in enumerate(previous.teams)}
+        params = np.zeros(2 + 2 * team_count)
+        params[:2] = previous.params[:2]
+        for i, team in enumerate(teams):
+            if team in index:
+                params[2 + i] = previous.attack[team]
+                params[2 + team_count + i] = previous.defence[team]
+        return params
+    params = np.zeros(2 + 2 * team_count)
+    goals = np.concatenate([matches.home_goals.values, matches.away_goals.values]).astype(float)
+    params[0] = np.log(max(goals.mean(), 0.1))
+    return params
+
+
+def fit_matches(teams, matches, previous=None):
+    """
+    Maximum-likelihood fit of a league's ratings with L-BFGS-B.
+
+    :param teams: team names
+    :param matches: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    :param previous: RatingFit to start from, e.g. the fit before the latest matchday
+    :return: RatingFit
+    """
+    from scipy.optimize import minimize
+    teams = list(teams)
+    index = {team: i for i, team in enumerate(teams)}
+    home = np.array([index[t] for t in matches.home_team], dtype=int)
+    away = np.array([index[t] for t in matches.away_team], dtype=int)
+    home_goals = matches.home_goals.values.astype(float)
+    away_goals = matches.away_goals.values.astype(float)
+    result = minimize(negative_log_likelihood, _starting_point(teams, matches, previous),
+                      args=(home, away, home_goals, away_goals, len(teams)), jac=True, method='L-BFGS-B',
+                      options={"maxiter": MAX_ITERATIONS, "gtol": TOLERANCE})
+    return RatingFit(teams, result.x, matches.reset_index(drop=True), result.nit, -result.fun)
+
+
+def _league_matches(schema, engine):
+    from classes import League
+    league = League(schema, engine)
+    data = league.load_match_data(engine)
+    # an opponent outside the league's team list can't be given ratings, so its matches are left out
+    home = data[(data.Venue == 'HOME') & data.Opponent.isin(league.teams)]
+    matches = pd.DataFrame({"date": home.Date.values, "home_team": home.Team.values,
+                            "away_team": home.Opponent.values, "home_goals": home.GF.values.astype(int),
+                            "away_goals": home.GA.values.astype(int)})
+    return league.teams, matches
+
+
+def fit(schema, engine=None, warm_start=True):
+    """
+    Fits a league's ratings from every match in the database and keeps the result, with the data version it was
+    fitted at, for get_fit() and later warm starts.
+
+    :param schema: name of league schema
+    :param engine: engine connected to the league schema, defaults to connect_to_db(schema)
+    :param warm_start: start from the league's previous fit if there is one
+    :return: RatingFit
+    """
+    engine = engine or connect_to_db(schema)
+    # read before the matches, so a write landing in between is refitted next time
+    version = get_version(schema, engine)
+    teams, matches = _league_matches(schema, engine)
+    with _lock:
+        previous = _fits.get(schema)
+    result = fit_matches(teams, matches, previous[1] if previous is not None and warm_start else None)
+    with _lock:
+        _fits[schema] = (version, result)
+    return result
+
+
+def get_fit(schema, engine=None):
+    """
+    Fit of a league's current data. The league is refitted, starting from its previous solution, whenever its data
+    version has moved on, so writes by any process are picked up without the writer having to fit anything.
+
+    :param schema: name of league schema
+    :param engine: engine connected to the league schema, defaults to connect_to_db(schema)
+    :return: RatingFit
+    """
+    engine = engine or connect_to_db(schema)
+    version = get_version(schema, engine)
+    with _lock:
+        entry = _fits.get(schema)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+    return fit(schema, engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit attack, defence and home advantage by maximum likelihood.")
+    parser.add_argument("league", choices=['premier_league', 'championship', 'league_one', 'league_two'])
+    args = parser.parse_args()
+    league_fit = get_fit(args.league)
+    home_average, away_average = league_fit.average_goals()
+    print("{} iterations, log-likelihood {:.3f}".format(league_fit.iterations, league_fit.log_likelihood))
+    print("Average goals: home {}, away {}\n".format(home_average, away_average))
+    print(league_fit.ratings()[['home_att', 'home_def']].rename(columns={"home_att": "ATT", "home_def": "DEF"})
+          .sort_values("ATT", ascending=False))
@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import Table, Column, MetaData, Integer, select
+from classes import League
+from db_connection import connect_to_db
+from matches_table import uses_matches_table
+
+MAX_LEAGUES = 4
+# seconds between reads of a league's data version, so a write by another process is seen within this long
+CHECK_INTERVAL = 5
+
+metadata = MetaData()
+
+# one row holding the version of the league's data, so every process reading the schema sees every write
+data_version = Table("data_version", metadata,
+                     Column("id", Integer, primary_key=True, autoincrement=False),
+                     Column("version", Integer, nullable=False))
+
+_checked = {}
+_cache = OrderedDict()
+_build_locks = {}
+_lock = threading.Lock()
+
+
+class LeagueRatings:
+    def __init__(self, league, ratings, version):
+        """
+        League tables, averages and team ratings for one version of a league's data.
+
+        :param league: League instance
+        :param ratings: DataFrame from League.ratings() with position and zone columns added
+        :param version: data version the ratings were built from
+        """
+        self.league = league
+        self.ratings = ratings
+        self.version = version
+
+    def expected_goals(self, team, venue, opponent):
+        """
+        Expected goals scored by a team against an opponent, using the same formula and rounding as
+        Team.expected_scored().
+
+        :param team: team name
+        :param venue: 'HOME' or 'AWAY', the venue of team
+        :param opponent: opponent name
+        :return: expected goals
+        """
+        if venue == 'AWAY':
+            return round(self.ratings.at[team, 'away_att'] * self.ratings.at[opponent, 'home_def'] *
+                         self.league.get_away_stats().aGF.values[0], 3)
+        return round(self.ratings.at[team, 'home_att'] * self.ratings.at[opponent, 'away_def'] *
+                     self.league.get_home_stats().aGF.values[0], 3)
+
+    def position(self, team):
+        return self.ratings.at[team, 'position']
+
+    def zone(self, team):
+        return self.ratings.at[team, 'zone']
+
+
+def _read_version(connection):
+    if not connection.dialect.has_table(connection, data_version.name):
+        return 0
+    version = connection.execute(select([data_version.c.version])).scalar()
+    return version or 0
+
+
+def get_version(league, engine=None, max_age=None):
+    """
+    Current data version of a league, as stored in its schema. Bumped by every write to the league's tables, in
+    whichever process makes the write.
+
+    :param league: name of league schema
+    :param engine: engine connected to the league schema, defaults to connect_to_db(league)
+    :param max_age: seconds a version read from the database is reused before it is read again, defaults to
+                    CHECK_INTERVAL
+    :return: integer version
+    """
+    max_age = CHECK_INTERVAL if max_age is None else max_age
+    now = time.monotonic()
+    with _lock:
+        checked = _checked.get(league)
+        if checked is not None and now - checked[1] < max_age:
+            return checked[0]
+    engine = engine or connect_to_db(league)
+    if not engine:
+        return 0
+    connection = engine.connect()
+    try:
+        version = _read_version(connection)
+    finally:
+        connection.close()
+    with _lock:
+        _checked[league] = (version, now)
+    return version
+
+
+def create_version_table(engine):
+    """
+    Creates a schema's data_version table and its row if they don't exist yet. Call before starting a transaction
+    that bumps the version, as MySQL commits any open transaction on CREATE TABLE.
+
+    :param engine: engine connected to the league schema
+    """
+    connection = engine.connect()
+    try:
+        if not engine.dialect.has_table(connection, data_version.name):
+            data_version.create(bind=connection)
+        if connection.execute(select([data_version.c.version])).scalar() is None:
+            connection.execute(data_version.insert().values(id=1, version=0))
+    finally:
+        connection.close()
+
+
+def bump_version(league, connection=None):
+    """
+    Marks a league's data as changed so that its cached ratings are rebuilt on next use, here and in every other
+    process reading the schema. Pass the connection of a write, after create_version_table(), to bump the version
+    in the same transaction as the write.
+
+    :param league: name of league schema
+    :param connection: open connection to the league schema, or None to bump in a transaction of its own
+    :return: new version
+    """
+    if connection is None:
+        engine = connect_to_db(league)
+        create_version_table(engine)
+        own_connection = engine.connect()
+        transaction = own_connection.begin()
+        try:
+            version = bump_version(league, own_connection)
+            transaction.commit()
+        except Exception:
+            transaction.rollback()
+            raise
+        finally:
+            own_connection.close()
+        return version
+
+    connection.execute(data_version.update().values(version=data_version.c.version + 1))
+    version = connection.execute(select([data_version.c.version])).scalar()
+    with _lock:
+        _cache.pop(league, None)
+        _checked.pop(league, None)
+    return version
+
+
+def invalidate(league=None):
+    """
+    Explicitly drops cached ratings, so that the next read rebuilds them and rereads the version.
+
+    :param league: name of league schema, or None to drop every league
+    """
+    with _lock:
+        for name in ([league] if league else list(set(_cache) | set(_checked))):
+            _cache.pop(name, None)
+            _checked.pop(name, None)
+
+
+def _build_lock(league):
+    with _lock:
+        if league not in _build_locks:
+            _build_locks[league] = threading.Lock()
+        return _build_locks[league]
+
+
+def get_ratings(league, engine):
+    """
+    Ratings for a league, served from memory while its version is unchanged. A rebuild costs the three League
+    table queries and one League.load_match_data() query; checking the version costs one small query every
+    CHECK_INTERVAL seconds.
+
+    :param league: name of league schema
+    :param engine: engine connected to the league schema
+    :return: LeagueRatings instance
+    """
+    version = get_version(league, engine)
+    with _lock:
+        entry = _cache.get(league)
+        if entry is not None and entry.version == version:
+            _cache.move_to_end(league)
+            return entry
+
+    # built under a lock of its own so a slow league doesn't hold up reads of the others
+    with _build_lock(league):
+        with _lock:
+            entry = _cache.get(league)
+            if entry is not None and entry.version == version:
+                return entry
+        layout = 'matches' if uses_matches_table(engine) else 'team_tables'
+        league_instance = League(league, engine, layout)
+        ratings = league_instance.ratings(engine)
+        positions = league_instance.data.reset_index().set_index('Team')['#']
+        ratings['position'] = positions.reindex(ratings.index)
+        ratings['zone'] = [league_instance.zone(p) for p in ratings.position]
+        entry = LeagueRatings(league_instance, ratings, version)
+        with _lock:
+            _cache[league] = entry
+            while len(_cache) > MAX_LEAGUES:
+                _cache.popitem(last=False)
+        return entry
@@ -1,8 +1,13 @@
+import numpy as np
 import pandas as pd
 from db_connection import connect_to_db
-import requests
-from bs4 import BeautifulSoup, SoupStrainer
+from fixture_fetcher import FIXTURE_URLS, fetch, fetch_fixture_pages
+from fixture_parser import parse_fixtures
 from classes import League, Team
+from score_matrix import score_matrix, market_probs, goal_vector
+from ratings_cache import get_ratings
+from prediction_cache import get_prediction
+from tracing import span, traced
 
 
 def read_from_db(team_identifier, engine):
@@ -19,88 +24,119 @@ def read_from_db(team_identifier, engine):
     return team_info
 
 
-def get_result_prob(home_team, away_team):
-    team_xgf = home_team.xgf()
-    opp_xgf = away_team.xgf()
-    home_wins = {}
-    draw = {}
-    away_wins = {}
-    prob_under = 0
-
-    for i, probability_i in enumerate(team_xgf):
-        for j, probability_j in enumerate(opp_xgf):
-            result_probability = round(probability_i * probability_j, 5)
-            if i + j < 3:
-                prob_under += result_probability
-            # print("Result {}-{}: {}".format(i, j, result_probability))
-            if i < j:
-                away_wins["{}-{}".format(i, j)] = result_probability
-            elif i == j:
-                draw["{}-{}".format(i, j)] = result_probability
-            elif i > j:
-                home_wins["{}-{}".format(i, j)] = result_probability
-
-    # for key, item in home_wins.items():
-    #     print("{}: {}".format(key, item))
-    # print("\n{} - {}".format(home_team.name, away_team.name))
-    # print("Home win: {}%".format(round(100 * sum(home_wins.values()), 5)))
-    # print("Draw: {}%".format(round(100 * sum(draw.values()), 5)))
-    # print("Away win: {}%".format(round(100 * sum(away_wins.values()), 5)))
-    # print("Probability O2.5 goals: {}%".format(round(100 * (1 - prob_under), 5)))
-    results_dict = {"home win": round(100 * sum(home_wins.values()), 5),
-                    "draw": round(100 * sum(draw.values()), 5),
-                    "away win": round(100 * sum(away_wins.values()), 5),
-                    "over": round(100 * (1 - prob_under), 5)}
+def _results_dict(matrix):
+    # every scoreline is rounded to 5 decimal places before the markets are summed, as the original pricing loop did
+    markets = market_probs(np.round(matrix, 5))
+    results_dict = {"home win": round(100 * float(markets["home win"]), 5),
+                    "draw": round(100 * float(markets["draw"]), 5),
+                    "away win": round(100 * float(markets["away win"]), 5),
+                    "over": round(100 * float(markets["over"][2.5]), 5)}
     return results_dict
 
 
+@traced("predict.get_result_prob")
+def get_result_prob(home_team, away_team):
+    """
+    Probabilities of a home win, draw, away win and over 2.5 goals, priced from the score matrix of the two teams.
+
+    :param home_team: Team instance with its opposition set
+    :param away_team: Team instance with its opposition set
+    :return: dictionary of percentages with keys "home win", "draw", "away win" and "over"
+    """
+    return _results_dict(score_matrix(home_team.xgf(), away_team.xgf()))
+
+
+def results_from_xg(home_xg, away_xg):
+    """
+    Same as get_result_prob(), but from expected goals rather than Team instances.
+
+    :param home_xg: expected goals of the first team
+    :param away_xg: expected goals of the second team
+    :return: dictionary of percentages with keys "home win", "draw", "away win" and "over"
+    """
+    return _results_dict(score_matrix(goal_vector(home_xg), goal_vector(away_xg)))
+
+
+def _swap_sides(results_dict):
+    swapped = dict(results_dict)
+    swapped["home win"], swapped["away win"] = results_dict["away win"], results_dict["home win"]
+    return swapped
+
+
+@traced("predict.prob_predictions")
 def prob_predictions(lid, tid, tid_venue, oid, oid_venue):
+    """
+    Predicts a match from the cached ratings of the league, only touching the database when the league's data has
+    changed since the ratings were built. Repeated requests for a fixture are answered from prediction_cache until
+    new results are written to the league.
+
+    :param lid: name of league schema
+    :param tid: team name
+    :param tid_venue: 'HOME' or 'AWAY'
+    :param oid: opponent name
+    :param oid_venue: 'HOME' or 'AWAY'
+    :return: dictionary of percentages as returned by get_result_prob(), from the point of view of tid
+    """
     if tid_venue == oid_venue:
         raise ValueError("Team venue and opponent venue cannot be the same!")
-    engine = connect_to_db(lid)
-    if engine:
-        league = League(lid, engine)
-        team = Team(tid, engine, league, tid_venue)
-        opponent = Team(oid, engine, league, oid_venue)
-        team.set_opposition(opponent)
-        opponent.set_opposition(team)
-        # team.plot_xgf()
-        # opponent.plot_xgf()
-        results_dict = get_result_prob(team, opponent)
-        return results_dict
-
-
-def read_fixtures(url, date):
-    pl_url = "https://ie.soccerway.com/national/england/premier-league/20192020/regular-season/r53145/matches/"
-    championship_url = "https://ie.soccerway.com/national/england/championship/20192020/regular-season/r53782/matches/"
-    league_one_url = "https://ie.soccerway.com/national/england/league-one/20192020/regular-season/r53677/matches/"
-    league_two_url = "https://ie.soccerway.com/national/england/league-two/20192020/regular-season/r53874/matches/"
-
-    url_dict = {"premier_league": pl_url,
-                "championship": championship_url,
-                "league_one": league_one_url,
-                "league_two": league_two_url}
-
-    page = requests.get(url_dict[url]).text
-    only_td = SoupStrainer("td")
-    soup = BeautifulSoup(page, 'html.parser', parse_only=only_td)
-    dates = soup.find_all(class_='date no-repetition')
-    input_date = date
+    home, away = (tid, oid) if tid_venue == 'HOME' else (oid, tid)
+
+    def compute():
+        engine = connect_to_db(lid)
+        if engine:
+            ratings = get_ratings(lid, engine)
+            return results_from_xg(ratings.expected_goals(home, 'HOME', away),
+                                   ratings.expected_goals(away, 'AWAY', home))
+
+    results_dict = get_prediction(lid, home, away, compute)
+    if results_dict is not None and tid_venue == 'AWAY':
+        # the market is symmetric apart from which side wins
+        results_dict = _swap_sides(results_dict)
+    return results_dict
+
+
+@traced("read_fixtures")
+def read_fixtures(url, date, page=None):
+    """
+    Predictions for every match of a league on a date, read from the league's soccerway season page
+
+    :param url: name of league schema
+    :param date: date as shown on soccerway
+    :param page: text of the season page if it has already been fetched, e.g. by read_all_fixtures()
+    :return: list of [home team, away team, results dictionary]
+    """
+    if page is None:
+        with span("scrape.fetch", league=url):
+            page = fetch(FIXTURE_URLS[url])
+    with span("scrape.parse", league=url):
+        fixtures = parse_fixtures(page, date)
     match_data = []
-    for d in dates:
-        if input_date == d.text:
-            score_time_status = d.find_next("td", class_="score-time status").find_next("a")
-            # don't read postponed games
-            if not score_time_status.text.strip() == "-":
-                home_team = d.find_next("td", class_="team team-a").find_next("a").get('title')
-                away_team = d.find_next("td", class_="team team-b").find_next("a").get('title')
-                # print(d.text, d.find_next("td", class_="team team-a").find_next("a").get('title'), "-",
-                #       d.find_next("td", class_="team team-b").find_next("a").get('title'))
-                results_dict = prob_predictions(url, home_team, 'HOME', away_team, 'AWAY')
-                match_data.append([home_team, away_team, results_dict])
+    for fixture in fixtures:
+        # don't read postponed games
+        if not fixture.status == "-":
+            results_dict = prob_predictions(url, fixture.home, 'HOME', fixture.away, 'AWAY')
+            match_data.append([fixture.home, fixture.away, results_dict])
     return match_data
 
 
+def read_all_fixtures(date, leagues=None):
+    """
+    Predictions for every match on a date across several leagues, fetching the season pages in parallel
+
+    :param date: date as shown on soccerway
+    :param leagues: league schema names, defaults to all four leagues
+    :return: dictionary mapping league to the list returned by read_fixtures()
+    """
+    pages = fetch_fixture_pages(leagues)
+    fixtures = {}
+    for league, page in pages.items():
+        if isinstance(page, Exception):
+            print("Could not fetch fixtures for {}: {}".format(league, page))
+            continue
+        fixtures[league] = read_fixtures(league, date, page)
+    return fixtures
+
+
 def match_predict(home_identifier, away_identifier, league_name):
     """
     Predict goals scored in match using Poisson distribution based on historical data for current season
@@ -122,10 +158,10 @@ def match_predict(home_identifier, away_identifier, league_name):
 
     home.plot_gf()
     home.plot_ga()
-    print(home.get_stats())
+    print(home.get_stats().to_frame())
     away.plot_gf()
     away.plot_ga()
-    print(away.get_stats())
+    print(away.get_stats().to_frame())
     # home_info = read_from_db(str(home_identifier), engine)
     # away_info = read_from_db(str(away_identifier), engine)
     # column_names = ['Team', 'GF', 'GA', 'TG', 'Games', 'aGF', 'aGA', 'aTG', 'o2.5']
@@ -1,80 +1,399 @@
+import argparse
 import imaplib
+import select
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db_connection import read_auth
 from read_data import read_fixtures
+from tracing import span, traced
 import email
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import time
 
+league_dict = {"premier_league": "Premier League",
+               "championship": "Championship",
+               "league_one": "League One",
+               "league_two": "League Two"}
 
-def connect_email_read(address, password):
-    gmail = imaplib.IMAP4_SSL("imap.gmail.com", 993)
+IMAP_HOST = "imap.gmail.com"
+IMAP_PORT = 993
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+
+# servers may drop an IDLE connection after 30 minutes (RFC 2177), so IDLE is restarted before then
+IDLE_TIMEOUT = 29 * 60
+# seconds between checks on servers without IDLE
+POLL_INTERVAL = 60
+RECONNECT_DELAY = 10
+# threads computing predictions; identical requests in flight share one computation
+WORKERS = 4
+
+
+@traced("imap.connect")
+def connect_email_read(address, password, host=IMAP_HOST, port=IMAP_PORT, use_ssl=True):
+    gmail = (imaplib.IMAP4_SSL if use_ssl else imaplib.IMAP4)(host, port)
     gmail.login(address, password)
     gmail.list()
     gmail.select("inbox")
     return gmail
 
 
-def connect_email_send(address, password):
-    session = smtplib.SMTP('smtp.gmail.com', 587)
-    session.starttls()
+@traced("smtp.connect")
+def connect_email_send(address, password, host=SMTP_HOST, port=SMTP_PORT, use_tls=True):
+    session = smtplib.SMTP(host, port)
+    if use_tls:
+        session.starttls()
     session.login(address, password)
     return session
 
 
-def scan_emails():
-    while True:
-        mail = connect_email_read(email_address, email_password)
-        send_session = connect_email_send(email_address, email_password)
-        result, data = mail.uid('search', None, "(UNSEEN)")
-        body = []
-        subject = ""
-        if result == "OK":
+class IdleSession:
+    def __init__(self, mail):
+        """
+        The IMAP IDLE exchange (RFC 2177), which imaplib doesn't provide, built on the connection's send(),
+        readline(), socket() and buffered reader. A response is only read once it is already buffered or select()
+        says it has arrived, so a timeout never leaves imaplib's reader unusable.
+
+        :param mail: IMAP connection with a mailbox selected
+        """
+        self.mail = mail
+        self.count = 0
+
+    def _buffered_line(self):
+        """
+        Whether a complete line is waiting in imaplib's reader, e.g. "* 1 EXISTS" sent in the same packet as
+        "+ idling", which select() on the socket would never report.
+        """
+        sock = self.mail.socket()
+        timeout = sock.gettimeout()
+        # peek() only reads from the socket when the reader is empty, and must not block doing so
+        sock.settimeout(0)
+        try:
+            buffered = self.mail.file.peek()
+        except (BlockingIOError, ssl.SSLWantReadError):
+            buffered = b""
+        finally:
+            sock.settimeout(timeout)
+        return b"\n" in buffered
+
+    def _readable(self, timeout):
+        sock = self.mail.socket()
+        # bytes already decrypted by an SSL socket don't wake select() either
+        if self._buffered_line() or (hasattr(sock, "pending") and sock.pending()):
+            return True
+        return bool(select.select([sock], [], [], timeout)[0])
+
+    def _readline(self, context):
+        line = self.mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed {}".format(context))
+        if line.startswith(b"* BYE"):
+            raise imaplib.IMAP4.abort("server said {} {}".format(line.strip(), context))
+        return line
+
+    @traced("imap.idle")
+    def wait(self, timeout=IDLE_TIMEOUT):
+        """
+        Waits until the server pushes a change to the selected mailbox or the timeout passes.
+
+        :param timeout: seconds to wait
+        :return: True if the server reported new messages
+        """
+        # tags of our own, lower case so they can't clash with the upper case ones imaplib generates
+        self.count += 1
+        tag = "idle{}".format(self.count).encode()
+        self.mail.send(tag + b" IDLE\r\n")
+        response = self._readline("starting IDLE")
+        if not response.startswith(b"+"):
+            raise imaplib.IMAP4.error("IDLE rejected: {}".format(response))
+
+        new_mail = False
+        if self._readable(timeout):
+            line = self._readline("during IDLE")
+            new_mail = b"EXISTS" in line or b"RECENT" in line
+
+        self.mail.send(b"DONE\r\n")
+        while True:
+            line = self._readline("while ending IDLE")
+            if line.startswith(tag + b" "):
+                if not line[len(tag) + 1:].startswith(b"OK"):
+                    raise imaplib.IMAP4.error("IDLE failed: {}".format(line))
+                return new_mail
+            new_mail = new_mail or b"EXISTS" in line or b"RECENT" in line
+
+
+@traced("email.build_reply")
+def build_reply(league, date):
+    """
+    Subject and body of the prediction email for a league's fixtures on a date.
+
+    :param league: name of league schema
+    :param date: date as shown on soccerway
+    :return: (subject, body)
+    """
+    fixture_data = read_fixtures(league, date)
+    subject = "{} {} fixture predictions".format(date, league_dict[league])
+    body = []
+    for i in fixture_data:
+        body.append("\nProbabilities for {} - {}".format(i[0], i[1]) +
+                    "\nHome win: {}%".format(i[2]['home win']) +
+                    "\nDraw: {}%".format(i[2]['draw']) +
+                    "\nAway win: {}%".format(i[2]['away win']) +
+                    "\nOver 2.5 Goals: {}%".format(i[2]['over']))
+    return subject, "\n".join(body)
+
+
+def parse_request(raw_email):
+    """
+    League and date requested by an email, given in the subject as "<league> <date>", e.g. "league_two 19/10/19".
+
+    :param raw_email: email.message.Message
+    :return: (league, date), or None if the subject isn't a valid request
+    """
+    subject = str(raw_email.get("Subject", "")).strip()
+    try:
+        league, date = subject.split(" ")
+    except ValueError:
+        return None
+    if league not in league_dict:
+        return None
+    return league, date
+
+
+class ReplySender:
+    def __init__(self, address, password, host=SMTP_HOST, port=SMTP_PORT, use_tls=True):
+        """
+        SMTP session that is only opened when a reply is due and then reused, reconnecting if the server has closed
+        it in the meantime.
+
+        :param address: sending address, also used to log in
+        :param password: password for address
+        :param host: SMTP server
+        :param port: SMTP port
+        :param use_tls: whether to upgrade the connection with STARTTLS
+        """
+        self.address = address
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.session = None
+        self._lock = threading.Lock()
+
+    def _connected(self):
+        if self.session is None:
+            return False
+        try:
+            return self.session.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, to, subject, body):
+        message = MIMEMultipart()
+        message['From'] = self.address
+        message['To'] = to
+        message['Subject'] = subject
+        message.attach(MIMEText(body, 'plain'))
+        email_text = message.as_string()
+        # workers share the session, but an SMTP conversation can only carry one message at a time
+        with self._lock:
+            for attempt in range(2):
+                if not self._connected():
+                    self._close()
+                    self.session = connect_email_send(self.address, self.password, self.host, self.port,
+                                                      self.use_tls)
+                try:
+                    with span("smtp.send"):
+                        self.session.sendmail(self.address, to, email_text)
+                    return
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+
+    def _close(self):
+        if self.session is not None:
             try:
-                latest_unread_email = data[0].split()[-1]
-            except IndexError:
-                latest_unread_email = False
-
-            if latest_unread_email:
-                print("\nNew email!")
-                fetch_result, fetch_data = mail.uid('fetch', latest_unread_email, '(RFC822)')
-                if fetch_result == "OK":
-                    raw_email = email.message_from_string(fetch_data[0][1].decode('utf-8'))
-                    email_subject = str(raw_email).split("Subject: ", 1)[1].split("\nTo:", 1)[0].split("\n")[0]
-                    league, date = email_subject.split(" ")
-                    fixture_data = read_fixtures(league, date)
-                    subject = "{} {} fixture predictions".format(date, league_dict[league])
-
-                    for i in fixture_data:
-                        body.append("\nProbabilities for {} - {}".format(i[0], i[1]) +
-                                    "\nHome win: {}%".format(i[2]['home win']) +
-                                    "\nDraw: {}%".format(i[2]['draw']) +
-                                    "\nAway win: {}%".format(i[2]['away win']) +
-                                    "\nOver 2.5 Goals: {}%".format(i[2]['over']))
-                    body = "\n".join(body)
-
-        if subject and body:
-            message = MIMEMultipart()
-            message['From'] = email_address
-            message['To'] = valid_sender
-            message['Subject'] = subject
-            message.attach(MIMEText(body, 'plain'))
-            email_text = message.as_string()
-            send_session.sendmail(email_address, valid_sender, email_text)
-            print("Sent predictions!")
-        time.sleep(60)
+                self.session.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.session = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class MailService:
+    def __init__(self, address, password, valid_sender, imap_host=IMAP_HOST, imap_port=IMAP_PORT, use_ssl=True,
+                 smtp_host=SMTP_HOST, smtp_port=SMTP_PORT, use_tls=True, workers=WORKERS, idle_session=IdleSession,
+                 idle_timeout=IDLE_TIMEOUT):
+        """
+        Answers prediction requests using one long-lived IMAP connection that waits for new mail with IDLE, and a
+        ReplySender for the answers. The IMAP connection is only used from the thread calling run(); predictions are
+        computed by a pool of worker threads, which also send the replies.
+
+        :param address: address the requests are sent to
+        :param password: password for address
+        :param valid_sender: address that replies are sent to
+        :param workers: number of worker threads
+        :param idle_session: class wrapping the IMAP connection with a wait(timeout) method, see IdleSession
+        :param idle_timeout: seconds each IDLE waits before it is restarted
+        """
+        self.address = address
+        self.password = password
+        self.valid_sender = valid_sender
+        self.imap_host = imap_host
+        self.imap_port = imap_port
+        self.use_ssl = use_ssl
+        self.sender = ReplySender(address, password, smtp_host, smtp_port, use_tls)
+        self.idle_session = idle_session
+        self.idle_timeout = idle_timeout
+        self.mail = None
+        self.idler = None
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def connect(self):
+        self.mail = connect_email_read(self.address, self.password, self.imap_host, self.imap_port, self.use_ssl)
+        self.idler = self.idle_session(self.mail) if "IDLE" in self.mail.capabilities else None
+
+    def wait_for_mail(self):
+        if self.idler is not None:
+            self.idler.wait(self.idle_timeout)
+        else:
+            self._stopped.wait(POLL_INTERVAL)
+            self.mail.noop()
+
+    def _prediction(self, request):
+        """
+        Future for the reply to a (league, date) request, shared with any identical request still being computed.
+        """
+        with self._lock:
+            future = self._in_flight.get(request)
+            if future is not None:
+                return future
+            future = self.executor.submit(build_reply, *request)
+            self._in_flight[request] = future
+        # added outside the lock: a future that has already finished runs the callback straight away
+        future.add_done_callback(lambda f: self._finished(request, f))
+        return future
+
+    def _finished(self, request, future):
+        with self._lock:
+            if self._in_flight.get(request) is future:
+                del self._in_flight[request]
+
+    def _reply(self, request, future):
+        try:
+            subject, body = future.result()
+            if subject and body:
+                self.sender.send(self.valid_sender, subject, body)
+                print("Sent predictions for {} {}!".format(*request))
+        except Exception as e:
+            print("Failed to answer {} {}: {}".format(request[0], request[1], e))
+
+    def submit(self, request):
+        """
+        Queues a (league, date) request; the worker that computes the prediction also sends the reply.
+
+        :param request: (league, date)
+        :return: Future of (subject, body)
+        """
+        future = self._prediction(request)
+        future.add_done_callback(lambda f: self._reply(request, f))
+        return future
+
+    def process_unseen(self):
+        """
+        Fetches every unread email in one command and queues each prediction request among them.
+
+        :return: number of requests queued
+        """
+        with span("imap.search"):
+            result, data = self.mail.uid('search', None, "(UNSEEN)")
+        if result != "OK" or not data or not data[0]:
+            return 0
+        uids = data[0].split()
+        print("\n{} new email(s)!".format(len(uids)))
+        with span("imap.fetch", messages=len(uids)):
+            fetch_result, fetch_data = self.mail.uid('fetch', b",".join(uids), '(RFC822)')
+        if fetch_result != "OK":
+            return 0
+        queued = 0
+        for part in fetch_data:
+            if not isinstance(part, tuple):
+                continue
+            request = parse_request(email.message_from_bytes(part[1]))
+            if request is None:
+                print("Ignoring email that isn't a prediction request.")
+                continue
+            self.submit(request)
+            queued += 1
+        return queued
+
+    def run(self):
+        """
+        Answers requests until stop() is called, reconnecting whenever the IMAP connection fails.
+        """
+        while not self._stopped.is_set():
+            try:
+                if self.mail is None:
+                    self.connect()
+                self.process_unseen()
+                self.wait_for_mail()
+            except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError) as e:
+                print("Lost connection to the mail server ({}), reconnecting...".format(e))
+                self.close_mail()
+                self._stopped.wait(RECONNECT_DELAY)
+
+    def stop(self):
+        """
+        Makes run() return once the current wait for mail ends.
+        """
+        self._stopped.set()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.sender.close()
+        self.close_mail()
+
+    def close_mail(self):
+        if self.mail is not None:
+            try:
+                self.mail.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+            self.mail = None
+            self.idler = None
+
+
+def scan_emails(email_address, email_password, valid_sender, **servers):
+    service = MailService(email_address, email_password, valid_sender, **servers)
+    try:
+        service.run()
+    finally:
+        service.close()
 
 
 if __name__ == "__main__":
-    league_dict = {"premier_league": "Premier League",
-                   "championship": "Championship",
-                   "league_one": "League One",
-                   "league_two": "League Two"}
-
-    with open("auth.txt", "r") as file:
-        text = file.readlines()
-
-    email_password = str(text[8].strip("\n"))
-    email_address = str(text[9].strip("\n"))
-    valid_sender = str(text[10].strip("\n"))
-    scan_emails()
+    parser = argparse.ArgumentParser(description="Answer prediction requests sent by email.")
+    parser.add_argument("--imap-host", default=IMAP_HOST)
+    parser.add_argument("--imap-port", type=int, default=IMAP_PORT)
+    parser.add_argument("--smtp-host", default=SMTP_HOST)
+    parser.add_argument("--smtp-port", type=int, default=SMTP_PORT)
+    parser.add_argument("--plain", action="store_true", help="don't use SSL/TLS, e.g. for a local test server")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    text = read_auth()
+    email_password = str(text[8])
+    email_address = str(text[9])
+    valid_sender = str(text[10])
+    scan_emails(email_address, email_password, valid_sender, imap_host=args.imap_host, imap_port=args.imap_port,
+                use_ssl=not args.plain, smtp_host=args.smtp_host, smtp_port=args.smtp_port, use_tls=not args.plain,
+                workers=args.workers)
@@ -0,0 +1,226 @@
+import threading
+from collections import deque
+import pandas as pd
+from matches_table import parse_dates
+from ratings_cache import get_version
+
+# matches in the last-N window
+WINDOW = 6
+# days after which a result counts half as much as a new one
+HALF_LIFE = 90
+MODES = ['season', 'recent', 'decay']
+
+_forms = {}
+_lock = threading.Lock()
+
+
+class TeamForm:
+    def __init__(self, window=WINDOW, half_life=HALF_LIFE):
+        """
+        Running goal totals of one team at one venue, updated in constant time per result: season sums, sums over
+        the last window results, and exponentially time-decayed sums.
+
+        :param window: number of results in the last-N window
+        :param half_life: half-life of the time decay in days
+        """
+        self.half_life = half_life
+        self.games = 0
+        self.gf = 0
+        self.ga = 0
+        self.recent = deque(maxlen=window)
+        self.recent_gf = 0
+        self.recent_ga = 0
+        self.weight = 0.0
+        self.decayed_gf = 0.0
+        self.decayed_ga = 0.0
+        self.last_date = None
+
+    def add(self, date, goals_for, goals_against):
+        """
+        Adds one result.
+
+        :param date: datetime.date of the match, or None if unknown
+        :param goals_for: goals scored
+        :param goals_against: goals conceded
+        """
+        self.games += 1
+        self.gf += goals_for
+        self.ga += goals_against
+
+        if len(self.recent) == self.recent.maxlen:
+            old_gf, old_ga = self.recent[0]
+            self.recent_gf -= old_gf
+            self.recent_ga -= old_ga
+        self.recent.append((goals_for, goals_against))
+        self.recent_gf += goals_for
+        self.recent_ga += goals_against
+
+        weight = 1.0
+        if date is not None and self.last_date is not None:
+            days = (date - self.last_date).days
+            if days >= 0:
+                # rather than ageing every old result, the existing sums are scaled down once
+                factor = 0.5 ** (days / float(self.half_life))
+                self.weight *= factor
+                self.decayed_gf *= factor
+                self.decayed_ga *= factor
+            else:
+                # a result older than the latest one is added with its age already applied
+                weight = 0.5 ** (-days / float(self.half_life))
+        if date is not None and (self.last_date is None or date > self.last_date):
+            self.last_date = date
+        self.weight += weight
+        self.decayed_gf += weight * goals_for
+        self.decayed_ga += weight * goals_against
+
+    def averages(self, mode='season'):
+        """
+        Goals scored and conceded per game.
+
+        :param mode: 'season' for the whole season, 'recent' for the last-N window or 'decay' for time-decayed
+        :return: (aGF, aGA), or (nan, nan) if no results have been added
+        """
+        if mode == 'recent':
+            games, gf, ga = len(self.recent), self.recent_gf, self.recent_ga
+        elif mode == 'decay':
+            games, gf, ga = self.weight, self.decayed_gf, self.decayed_ga
+        else:
+            games, gf, ga = self.games, self.gf, self.ga
+        if not games:
+            return float('nan'), float('nan')
+        return gf / float(games), ga / float(games)
+
+
+class LeagueForm:
+    def __init__(self, teams, window=WINDOW, half_life=HALF_LIFE):
+        """
+        TeamForm of every team in a league at home and away.
+
+        :param teams: team names
+        :param window: number of results in the last-N window
+        :param half_life: half-life of the time decay in days
+        """
+        self.teams = list(teams)
+        self.window = window
+        self.half_life = half_life
+        self.forms = {(team, venue): TeamForm(window, half_life) for team in self.teams for venue in ['HOME', 'AWAY']}
+
+    def add_matches(self, matches):
+        """
+        Adds results to both teams of each match.
+
+        :param matches: dataframe with columns date, home_team, away_team, home_goals, away_goals
+        """
+        dates = parse_dates(list(matches.date))
+        for date, home, away, home_goals, away_goals in zip(dates, matches.home_team, matches.away_team,
+                                                            matches.home_goals, matches.away_goals):
+            date = None if pd.isnull(date) else date
+            for key, goals_for, goals_against in [((home, 'HOME'), home_goals, away_goals),
+                                                  ((away, 'AWAY'), away_goals, home_goals)]:
+                if key not in self.forms:
+                    self.forms[key] = TeamForm(self.window, self.half_life)
+                self.forms[key].add(date, int(goals_for), int(goals_against))
+
+    def ratings(self, mode='season'):
+        """
+        ATT and DEF of every team at home and away: each team's average divided by the league average for the venue,
+        where the league average is the mean of the team averages, as in League and Team.set_stats(). With mode
+        'season' this gives the same ratings as League.ratings().
+
+        :param mode: 'season', 'recent' or 'decay', see TeamForm.averages()
+        :return: DataFrame indexed by team with columns home_att, home_def, away_att, away_def
+        """
+        columns = {}
+        for venue in ['HOME', 'AWAY']:
+            averages = pd.DataFrame([self.forms[(team, venue)].averages(mode) for team in self.teams],
+                                    index=pd.Index(self.teams, name='Team'), columns=['aGF', 'aGA'])
+            league_averages = averages.mean().round(3)
+            averages = averages.round(3)
+            columns[venue.lower() + '_att'] = (averages.aGF / league_averages.aGF).round(3)
+            columns[venue.lower() + '_def'] = (averages.aGA / league_averages.aGA).round(3)
+        return pd.DataFrame(columns)[['home_att', 'home_def', 'away_att', 'away_def']]
+
+
+def _seed(schema, engine):
+    """
+    Builds a league's form from its existing results, read with one League.load_match_data() query and added in date
+    order.
+    """
+    from classes import League
+    league = League(schema, engine)
+    if not league.name:
+        return None
+    data = league.load_match_data(engine)
+    home = data[data.Venue == 'HOME'].assign(parsed=parse_dates(data[data.Venue == 'HOME'].Date).values)
+    home = home.sort_values('parsed', kind='mergesort')
+    form = LeagueForm(league.teams)
+    form.add_matches(pd.DataFrame({"date": home.Date.values, "home_team": home.Team.values,
+                                   "away_team": home.Opponent.values, "home_goals": home.GF.values,
+                                   "away_goals": home.GA.values}))
+    return form
+
+
+def get_form(schema, engine):
+    """
+    Rolling form of a league, built from the database on first use and kept up to date by add_results() after that.
+    It is rebuilt whenever the league's data version has moved on without it, e.g. after a write by another process.
+
+    :param schema: name of league schema
+    :param engine: engine connected to the league schema
+    :return: LeagueForm, or None if schema isn't a league
+    """
+    version = get_version(schema, engine)
+    with _lock:
+        entry = _forms.get(schema)
+        if entry is None or entry[0] != version:
+            entry = _forms[schema] = (version, _seed(schema, engine))
+        return entry[1]
+
+
+def form_ratings(schema, engine, mode='season'):
+    """
+    Current ATT and DEF of every team, read from the rolling form without rescanning past results.
+
+    :param schema: name of league schema
+    :param engine: engine connected to the league schema
+    :param mode: 'season', 'recent' or 'decay'
+    :return: DataFrame indexed by team with columns home_att, home_def, away_att, away_def
+    """
+    if mode not in MODES:
+        raise ValueError("Unknown ratings mode {}, expected one of {}".format(mode, MODES))
+    form = get_form(schema, engine)
+    with _lock:
+        return form.ratings(mode)
+
+
+def add_results(schema, matches, version):
+    """
+    Adds committed results to a league's form if it is up to date with the write that stored them; otherwise the
+    form is dropped and rebuilt on next use.
+
+    :param schema: name of league schema
+    :param matches: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    :param version: data version of the league after the write, as returned by ratings_cache.bump_version()
+    """
+    with _lock:
+        entry = _forms.get(schema)
+        if entry is None:
+            return
+        if entry[0] == version - 1 and entry[1] is not None:
+            entry[1].add_matches(matches)
+            _forms[schema] = (version, entry[1])
+        else:
+            del _forms[schema]
+
+
+def reset(schema=None):
+    """
+    Drops in-memory form so that it is rebuilt from the database on next use, e.g. after tables were rebuilt.
+
+    :param schema: name of league schema, or None for every league
+    """
+    with _lock:
+        if schema is None:
+            _forms.clear()
+        else:
+            _forms.pop(schema, None)
@@ -0,0 +1,101 @@
+import math
+import numpy as np
+
+OVER_UNDER_LINES = [0.5, 1.5, 2.5, 3.5, 4.5]
+
+
+def poisson_pmf(mu, max_goals):
+    """
+    Poisson probabilities of scoring 0 to max_goals goals, built with a cumulative product instead of factorials.
+
+    :param mu: expected goals, either a scalar or an array of any shape
+    :param max_goals: highest number of goals to include
+    :return: array of shape mu.shape + (max_goals + 1,)
+    """
+    mu = np.asarray(mu, dtype=float)[..., np.newaxis]
+    ratios = mu / np.arange(1, max_goals + 1)
+    ones = np.ones(mu.shape[:-1] + (1,))
+    return np.exp(-mu) * np.cumprod(np.concatenate([ones, ratios], axis=-1), axis=-1)
+
+
+def goal_vector(xg):
+    """
+    Goal distribution for a single team as used by Team.xgf(): probabilities of 0 to ceil(xg) + 5 goals, rounded to
+    5 decimal places.
+
+    :param xg: expected goals
+    :return: array of probabilities
+    """
+    return np.round(poisson_pmf(xg, math.ceil(xg) + 5), 5)
+
+
+def score_matrix(home_probs, away_probs):
+    """
+    Joint scoreline distribution as the outer product of the home and away goal distributions.
+
+    :param home_probs: probabilities of the home team scoring 0, 1, 2, ... goals (leading axes are batch axes)
+    :param away_probs: probabilities of the away team scoring 0, 1, 2, ... goals (leading axes are batch axes)
+    :return: array where [..., i, j] is the probability of the scoreline i-j
+    """
+    home_probs = np.asarray(home_probs, dtype=float)
+    away_probs = np.asarray(away_probs, dtype=float)
+    return home_probs[..., :, np.newaxis] * away_probs[..., np.newaxis, :]
+
+
+def market_probs(matrix, lines=None):
+    """
+    Every market priced from a score matrix in one pass. Works on a single matrix or a stack of matrices, in which
+    case every value below gains the leading batch axes of the input.
+
+    Over probabilities are taken as 1 - under so that the mass cut off by truncating the matrix counts as goals.
+
+    :param matrix: score matrix from score_matrix(), [..., home goals, away goals]
+    :param lines: over/under goal lines to price, defaults to OVER_UNDER_LINES
+    :return: dictionary with keys "home win", "draw", "away win", "over", "under", "btts", "correct score",
+             "goal difference" and "total goals"
+    """
+    if lines is None:
+        lines = OVER_UNDER_LINES
+    matrix = np.asarray(matrix, dtype=float)
+    rows, cols = matrix.shape[-2:]
+    home_goals = np.arange(rows)[:, np.newaxis]
+    away_goals = np.arange(cols)[np.newaxis, :]
+
+    # collapse the matrix along its anti-diagonals (total goals) and diagonals (goal difference)
+    totals = np.arange(rows + cols - 1)
+    total_goals = np.tensordot(matrix, (home_goals + away_goals) == totals[:, np.newaxis, np.newaxis],
+                               axes=([-2, -1], [1, 2]))
+    differences = np.arange(-(cols - 1), rows)
+    goal_difference = np.tensordot(matrix, (home_goals - away_goals) == differences[:, np.newaxis, np.newaxis],
+                                   axes=([-2, -1], [1, 2]))
+
+    under = {line: total_goals[..., totals < line].sum(axis=-1) for line in lines}
+    results_dict = {"home win": goal_difference[..., differences > 0].sum(axis=-1),
+                    "draw": goal_difference[..., differences == 0].sum(axis=-1),
+                    "away win": goal_difference[..., differences < 0].sum(axis=-1),
+                    "over": {line: 1 - p for line, p in under.items()},
+                    "under": under,
+                    "btts": matrix[..., 1:, 1:].sum(axis=(-2, -1)),
+                    "correct score": matrix,
+                    "goal difference": {int(d): goal_difference[..., k] for k, d in enumerate(differences)},
+                    "total goals": total_goals}
+    return results_dict
+
+
+def matchup_markets(home_xg, away_xg, max_goals=None, lines=None):
+    """
+    Prices any number of fixtures at once from arrays of expected goals.
+
+    :param home_xg: expected home goals, array of any shape
+    :param away_xg: expected away goals, same shape as home_xg
+    :param max_goals: highest scoreline considered for each side, defaults to ceil(largest xG) + 5
+    :param lines: over/under goal lines to price, defaults to OVER_UNDER_LINES
+    :return: market_probs() dictionary with the shape of home_xg as leading axes
+    """
+    home_xg = np.asarray(home_xg, dtype=float)
+    away_xg = np.asarray(away_xg, dtype=float)
+    if max_goals is None:
+        largest = np.nanmax([np.nanmax(home_xg), np.nanmax(away_xg)])
+        max_goals = int(np.ceil(largest)) + 5
+    matrix = score_matrix(poisson_pmf(home_xg, max_goals), poisson_pmf(away_xg, max_goals))
+    return market_probs(matrix, lines)
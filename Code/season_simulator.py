@@ -0,0 +1,155 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from db_connection import connect_to_db
+from ratings_cache import get_ratings
+
+SEASONS = 10000
+BATCH_SIZE = 2500
+
+
+def remaining_fixtures(league):
+    """
+    Fixtures not played yet, i.e. every home/away pairing of the league's teams that isn't in its HOME match data.
+
+    :param league: League instance with its match data loaded
+    :return: list of (home team, away team)
+    """
+    match_data = league.get_match_data()
+    home_games = match_data[match_data.Venue == 'HOME']
+    played = set(zip(home_games.Team, home_games.Opponent))
+    return [(home, away) for home in league.teams for away in league.teams
+            if home != away and (home, away) not in played]
+
+
+def season_state(ratings):
+    """
+    Arrays the simulation runs on: the current table and the expected goals of every remaining fixture, priced with
+    the same formula as Team.expected_scored().
+
+    :param ratings: LeagueRatings instance from ratings_cache.get_ratings()
+    :return: dictionary of numpy arrays
+    """
+    league = ratings.league
+    teams = list(league.teams)
+    index = {team: i for i, team in enumerate(teams)}
+    table = league.data.set_index('Team').reindex(teams)
+    fixtures = remaining_fixtures(league)
+    home = np.array([index[h] for h, _ in fixtures], dtype=int)
+    away = np.array([index[a] for _, a in fixtures], dtype=int)
+    # a team yet to play at a venue has no rating there, so it is treated as average until it does
+    team_ratings = ratings.ratings.reindex(teams)[['home_att', 'home_def', 'away_att', 'away_def']].fillna(1.0)
+    home_xg = np.round(team_ratings.home_att.values[home] * team_ratings.away_def.values[away] *
+                       league.get_home_stats().aGF.values[0], 3)
+    away_xg = np.round(team_ratings.away_att.values[away] * team_ratings.home_def.values[home] *
+                       league.get_away_stats().aGF.values[0], 3)
+    # one-hot maps from fixtures to teams, so per-team totals of a batch are a single matrix product
+    home_map = np.zeros((len(fixtures), len(teams)))
+    home_map[np.arange(len(fixtures)), home] = 1
+    away_map = np.zeros((len(fixtures), len(teams)))
+    away_map[np.arange(len(fixtures)), away] = 1
+    return {"teams": teams,
+            "points": table.P.values.astype(float),
+            "gd": table.GD.values.astype(float),
+            "gf": table.GF.values.astype(float),
+            "home_xg": home_xg,
+            "away_xg": away_xg,
+            "home_map": home_map,
+            "away_map": away_map}
+
+
+def simulate_batch(state, seasons, seed):
+    """
+    Plays out the rest of the season many times at once. Ties on points are split by goal difference, then goals
+    scored, then at random.
+
+    :param state: dictionary from season_state()
+    :param seasons: number of seasons to simulate
+    :param seed: seed for the batch's numpy RandomState
+    :return: (N x N array counting how often team i finished in position j + 1, total points of each team)
+    """
+    random_state = np.random.RandomState(seed)
+    team_count = len(state["teams"])
+    home_goals = random_state.poisson(state["home_xg"], size=(seasons, len(state["home_xg"])))
+    away_goals = random_state.poisson(state["away_xg"], size=(seasons, len(state["away_xg"])))
+    draws = home_goals == away_goals
+    home_points = 3 * (home_goals > away_goals) + draws
+    away_points = 3 * (away_goals > home_goals) + draws
+    points = state["points"] + home_points.dot(state["home_map"]) + away_points.dot(state["away_map"])
+    margin = home_goals - away_goals
+    gd = state["gd"] + margin.dot(state["home_map"]) - margin.dot(state["away_map"])
+    gf = state["gf"] + home_goals.dot(state["home_map"]) + away_goals.dot(state["away_map"])
+    tiebreak = random_state.random_sample((seasons, team_count))
+
+    # teams from first to last in each season; lexsort sorts on the last key first
+    order = np.lexsort((tiebreak, -gf, -gd, -points), axis=-1)
+    positions = np.empty_like(order)
+    np.put_along_axis(positions, order, np.arange(team_count)[np.newaxis, :], axis=-1)
+    counts = np.bincount((np.arange(team_count) * team_count + positions).ravel(),
+                         minlength=team_count * team_count).reshape(team_count, team_count)
+    return counts, points.sum(axis=0)
+
+
+def _batches(seasons, batch_size, seed):
+    sizes = [batch_size] * (seasons // batch_size)
+    if seasons % batch_size:
+        sizes.append(seasons % batch_size)
+    seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, size=len(sizes))
+    return sizes, [int(s) for s in seeds]
+
+
+def simulate(league, engine, seasons=SEASONS, batch_size=BATCH_SIZE, processes=None, seed=None):
+    """
+    Monte Carlo final table of a league from its current table and team ratings.
+
+    :param league: name of league schema
+    :param engine: engine connected to the league schema
+    :param seasons: number of seasons to simulate
+    :param batch_size: seasons simulated per numpy batch
+    :param processes: spread the batches over this many processes, or None to run them in this process
+    :param seed: seed for reproducible results
+    :return: DataFrame indexed by team, sorted by expected points, with columns xPts, title, top 3, top 6 and
+             bottom 3 (zones as in League.zone()) followed by the probability of each finishing position
+    """
+    ratings = get_ratings(league, engine)
+    state = season_state(ratings)
+    sizes, seeds = _batches(seasons, batch_size, seed)
+    if processes:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(simulate_batch, [state] * len(sizes), sizes, seeds))
+    else:
+        results = [simulate_batch(state, size, s) for size, s in zip(sizes, seeds)]
+    counts = sum(r[0] for r in results)
+    total_points = sum(r[1] for r in results)
+
+    team_count = len(state["teams"])
+    probabilities = counts / float(seasons)
+    zones = np.array([ratings.league.zone(p) for p in range(1, team_count + 1)])
+    summary = pd.DataFrame({"xPts": np.round(total_points / seasons, 2),
+                            "title": probabilities[:, 0],
+                            "top 3": probabilities[:, zones == 1].sum(axis=1),
+                            "top 6": probabilities[:, (zones == 1) | (zones == 2)].sum(axis=1),
+                            "bottom 3": probabilities[:, zones == -1].sum(axis=1)},
+                           index=pd.Index(state["teams"], name='Team'),
+                           columns=["xPts", "title", "top 3", "top 6", "bottom 3"])
+    positions = pd.DataFrame(probabilities, index=summary.index, columns=range(1, team_count + 1))
+    return pd.concat([summary, positions], axis=1).sort_values("xPts", ascending=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the rest of the season and print final table odds.")
+    parser.add_argument("league", choices=['premier_league', 'championship', 'league_one', 'league_two'])
+    parser.add_argument("--seasons", type=int, default=SEASONS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    table = simulate(args.league, connect_to_db(args.league), args.seasons, args.batch_size, args.processes,
+                     args.seed)
+    elapsed = time.perf_counter() - start
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(table[["xPts", "title", "top 3", "top 6", "bottom 3"]].round(3))
+    print("\n{} seasons in {:.2f}s ({:.0f} seasons/s)".format(args.seasons, elapsed, args.seasons / elapsed))
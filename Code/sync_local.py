@@ -0,0 +1,90 @@
+import argparse
+import os
+import sqlalchemy as sqla
+from sqlalchemy import MetaData, Table, Column, Index, String
+from db_connection import connect_to_db, dispose_engines, sqlite_path, VALID_SCHEMAS
+
+
+def _portable_type(column_type):
+    """
+    Generic equivalent of a reflected MySQL column type, dropping MySQL-only options such as collations and display
+    widths that SQLite can't parse.
+    """
+    affinity = column_type._type_affinity
+    if issubclass(affinity, String):
+        return String(getattr(column_type, "length", None))
+    return affinity()
+
+
+def _local_table(remote_table, metadata):
+    columns = [Column(c.name, _portable_type(c.type), primary_key=c.primary_key, nullable=c.nullable)
+               for c in remote_table.columns]
+    table = Table(remote_table.name, metadata, *columns)
+    for index in remote_table.indexes:
+        Index(index.name, *[table.c[c.name] for c in index.columns], unique=index.unique)
+    return table
+
+
+def sync_schema(schema, directory=None, chunk_size=5000):
+    """
+    Mirrors every table of a remote schema into a local SQLite file with the same tables, keys and indexes. The copy
+    is written to a temporary file and swapped in at the end, so readers of the old file are never left with a
+    partial copy.
+
+    :param schema: name of league schema
+    :param directory: folder for the local files, defaults to the one chosen with db_connection.set_backend()
+    :param chunk_size: rows copied per batch
+    :return: dictionary mapping table name to the number of rows copied
+    """
+    remote = connect_to_db(schema, backend="mysql")
+    if not remote:
+        return {}
+    path = sqlite_path(schema, directory)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = path + ".tmp"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+    remote_metadata = MetaData()
+    remote_metadata.reflect(bind=remote)
+    local = sqla.create_engine("sqlite:///" + temp_path)
+    local_metadata = MetaData()
+    tables = [(remote_table, _local_table(remote_table, local_metadata))
+              for remote_table in remote_metadata.sorted_tables]
+    local_metadata.create_all(bind=local)
+
+    counts = {}
+    remote_connection = remote.connect()
+    local_connection = local.connect()
+    transaction = local_connection.begin()
+    try:
+        for remote_table, local_table in tables:
+            counts[remote_table.name] = 0
+            result = remote_connection.execute(remote_table.select())
+            rows = result.fetchmany(chunk_size)
+            while rows:
+                local_connection.execute(local_table.insert(), [dict(zip(result.keys(), row)) for row in rows])
+                counts[remote_table.name] += len(rows)
+                rows = result.fetchmany(chunk_size)
+        transaction.commit()
+    except Exception:
+        transaction.rollback()
+        raise
+    finally:
+        remote_connection.close()
+        local_connection.close()
+        local.dispose()
+
+    dispose_engines(backend="sqlite", schema=schema)
+    os.replace(temp_path, path)
+    print("{}: copied {} table(s), {} row(s) to {}".format(schema, len(counts), sum(counts.values()), path))
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mirror the remote league schemas into local SQLite files.")
+    parser.add_argument("leagues", nargs="*", default=VALID_SCHEMAS)
+    parser.add_argument("--directory", default=None, help="folder for the local files")
+    args = parser.parse_args()
+    for league in args.leagues:
+        sync_schema(league, args.directory)
@@ -0,0 +1,204 @@
+import atexit
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+# tracing is off unless FOOTBALL_TRACE is set; FOOTBALL_TRACE_FILE is written at exit, as Prometheus text if it ends
+# in .prom and as JSON lines otherwise
+_settings = {"enabled": os.environ.get("FOOTBALL_TRACE", "") not in ("", "0"),
+             "file": os.environ.get("FOOTBALL_TRACE_FILE")}
+
+MAX_EVENTS = 100000
+
+_stats = {}
+_events = deque(maxlen=MAX_EVENTS)
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(enabled=True):
+    """
+    Turns tracing on or off for the rest of the process.
+
+    :param enabled: whether spans are recorded
+    """
+    _settings["enabled"] = enabled
+
+
+def is_enabled():
+    return _settings["enabled"]
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.start = None
+        self.started_at = None
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self.name)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        _record(self.name, duration, self.started_at, self.parent, exc_type is not None, self.tags)
+        return False
+
+
+def span(name, **tags):
+    """
+    Context manager timing a block of code, e.g.
+
+        with span("scrape.parse", league=league):
+            ...
+
+    When tracing is disabled this returns a shared object that does nothing.
+
+    :param name: span name, dotted by stage
+    :param tags: extra values stored with the span's JSON line
+    """
+    if not _settings["enabled"]:
+        return _NO_SPAN
+    return _Span(name, tags)
+
+
+def traced(name):
+    """
+    Decorator recording every call of a function as a span. When tracing is disabled the only cost is one dictionary
+    lookup per call.
+
+    :param name: span name
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _settings["enabled"]:
+                return function(*args, **kwargs)
+            with _Span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _record(name, duration, started_at, parent, failed, tags):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0}
+        stats["count"] += 1
+        stats["errors"] += int(failed)
+        stats["total"] += duration
+        stats["max"] = max(stats["max"], duration)
+        event = {"name": name, "start": round(started_at, 6), "duration_ms": round(1000 * duration, 3),
+                 "parent": parent, "thread": threading.current_thread().name, "error": failed}
+        if tags:
+            event.update(tags)
+        _events.append(event)
+
+
+def summary():
+    """
+    Count, errors, total, mean and max duration of every span name recorded so far.
+
+    :return: dictionary mapping span name to a dictionary of those statistics, durations in milliseconds
+    """
+    with _lock:
+        return {name: {"count": s["count"],
+                       "errors": s["errors"],
+                       "total_ms": round(1000 * s["total"], 3),
+                       "mean_ms": round(1000 * s["total"] / s["count"], 3),
+                       "max_ms": round(1000 * s["max"], 3)}
+                for name, s in sorted(_stats.items())}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _events.clear()
+
+
+def _write(path, content):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def dump_jsonl(path):
+    """
+    Writes every recorded span as one JSON object per line.
+
+    :param path: output file
+    """
+    with _lock:
+        events = list(_events)
+    _write(path, "".join(json.dumps(event, default=str) + "\n" for event in events))
+
+
+def prometheus_text():
+    """
+    Span statistics in the Prometheus text exposition format, e.g. for the node exporter's textfile collector.
+
+    :return: text
+    """
+    lines = ["# HELP football_span_seconds Time spent in traced stages.",
+             "# TYPE football_span_seconds summary"]
+    with _lock:
+        stats = sorted(_stats.items())
+    for name, s in stats:
+        lines.append('football_span_seconds_count{{span="{}"}} {}'.format(name, s["count"]))
+        lines.append('football_span_seconds_sum{{span="{}"}} {:.6f}'.format(name, s["total"]))
+    lines += ["# HELP football_span_max_seconds Slowest call of each traced stage.",
+              "# TYPE football_span_max_seconds gauge"]
+    lines += ['football_span_max_seconds{{span="{}"}} {:.6f}'.format(name, s["max"]) for name, s in stats]
+    lines += ["# HELP football_span_errors_total Traced calls that raised an exception.",
+              "# TYPE football_span_errors_total counter"]
+    lines += ['football_span_errors_total{{span="{}"}} {}'.format(name, s["errors"]) for name, s in stats]
+    return "\n".join(lines) + "\n"
+
+
+def dump_prometheus(path):
+    """
+    Writes prometheus_text() to a file.
+
+    :param path: output file, e.g. ending in .prom
+    """
+    _write(path, prometheus_text())
+
+
+@atexit.register
+def _dump_at_exit():
+    path = _settings["file"]
+    if not path or not _stats:
+        return
+    if path.endswith(".prom"):
+        dump_prometheus(path)
+    else:
+        dump_jsonl(path)
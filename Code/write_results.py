@@ -1,12 +1,34 @@
 from db_connection import connect_to_db
+from ratings_cache import bump_version, create_version_table
+from ingest_log import filter_new, log_matches, remember
+from rolling_ratings import add_results
+from matches_table import matches as matches_table, match_records, uses_matches_table
 import re
+import sys
 import feedparser
-from sqlalchemy import exc
+from http_cache import get_content
+from sqlalchemy import exc, text
 import pandas as pd
 import numpy as np
 
 pd.options.display.max_columns = 999
 
+MATCH_COLUMNS = ["date", "home_team", "away_team", "home_goals", "away_goals"]
+TEAM_COLUMNS = ["date", "opponent", "goals_for", "goals_against", "total_goals", "win", "draw", "loss"]
+
+FEED_URLS = {"PL": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1204",
+             "C": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1205",
+             "L1": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1206",
+             "L2": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1197"}
+
+# seconds a feed is reused before it is revalidated
+FEED_TTL = 300
+
+SCHEMAS = {"PL": "premier_league",
+           "C": "championship",
+           "L1": "league_one",
+           "L2": "league_two"}
+
 
 def write_to_db(team_identifier, team_df, engine):
     """
@@ -56,6 +78,22 @@ def get_match_result(home_goals, away_goals):
     return [home_win, home_loss, draw, away_win, away_loss]
 
 
+def parse_entry(entry):
+    """
+    Parse a single result from the RSS feed
+    :param entry: feed entry
+    :return: list in the form [date, home team, away team, home goals, away goals]
+    """
+    date = entry.published
+    home_team = entry.title.split(" v ")[0]
+    away_team = entry.title.split(" v ")[1]
+    result = re.split("<.+?>", entry.summary_detail.value)[1].replace(str(home_team + " "), "").replace(
+        str(" " + away_team), "")
+    home_goals = int(result.split(" - ")[0])
+    away_goals = int(result.split(" - ")[1])
+    return [date, home_team, away_team, home_goals, away_goals]
+
+
 def prepare_df(data, entry):
     """
     Parse data from RSS feed into format for database
@@ -63,15 +101,9 @@ def prepare_df(data, entry):
     :param entry: which result from the RSS feed to be considered
     :return: list containing data and dataframes
     """
-    date = data.entries[entry].published
-    home_team = data.entries[entry].title.split(" v ")[0]
-    away_team = data.entries[entry].title.split(" v ")[1]
+    [date, home_team, away_team, home_goals, away_goals] = parse_entry(data.entries[entry])
     home_team_identifier = home_team + " HOME"
     away_team_identifier = away_team + " AWAY"
-    result = re.split("<.+?>", data.entries[entry].summary_detail.value)[1].replace(str(home_team + " "), "").replace(
-        str(" " + away_team), "")
-    home_goals = int(result.split(" - ")[0])
-    away_goals = int(result.split(" - ")[1])
     total_goals = int(home_goals + away_goals)
     [home_win, home_loss, draw, away_win, away_loss] = get_match_result(home_goals, away_goals)
     column_names = ["date", "opponent", "goals_for", "goals_against", "total_goals", "win", "draw", "loss"]
@@ -82,6 +114,128 @@ def prepare_df(data, entry):
     return [date, home_team, home_df, home_team_identifier, away_team, away_df, away_team_identifier]
 
 
+def matches_frame(data, date_list):
+    """
+    Parse every feed entry played on one of the selected dates into a single typed dataframe
+    :param data: parsed RSS feed
+    :param date_list: dates to keep
+    :return: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    """
+    matches = [parse_entry(entry) for entry in data.entries if entry.published in date_list]
+    matches = pd.DataFrame(matches, columns=MATCH_COLUMNS)
+    return matches.astype({"home_goals": int, "away_goals": int})
+
+
+def team_rows(matches):
+    """
+    Expand matches into the rows written to each team's HOME and AWAY tables
+    :param matches: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    :return: dataframe with columns team, venue, date, opponent, goals_for, goals_against, total_goals, win, draw,
+             loss
+    """
+    rows = []
+    for match in matches.itertuples(index=False):
+        [home_win, home_loss, draw, away_win, away_loss] = get_match_result(match.home_goals, match.away_goals)
+        total_goals = int(match.home_goals + match.away_goals)
+        rows.append([match.home_team, "HOME", match.date, match.away_team, match.home_goals, match.away_goals,
+                     total_goals, home_win, draw, home_loss])
+        rows.append([match.away_team, "AWAY", match.date, match.home_team, match.away_goals, match.home_goals,
+                     total_goals, away_win, draw, away_loss])
+    return pd.DataFrame(rows, columns=["team", "venue"] + TEAM_COLUMNS)
+
+
+def league_table_deltas(rows):
+    """
+    Fold team rows into one change per team for each league table
+    :param rows: dataframe from team_rows()
+    :return: dictionary mapping table name to a dataframe with columns team, mp, w, d, l, gf, ga
+    """
+    rows = rows.rename(columns={"goals_for": "gf", "goals_against": "ga", "win": "w", "draw": "d", "loss": "l"})
+    rows = rows.assign(mp=1)
+    columns = ["mp", "w", "d", "l", "gf", "ga"]
+    return {"league_table": rows.groupby("team")[columns].sum().reset_index(),
+            "home_league_table": rows[rows.venue == "HOME"].groupby("team")[columns].sum().reset_index(),
+            "away_league_table": rows[rows.venue == "AWAY"].groupby("team")[columns].sum().reset_index()}
+
+
+def _records(df):
+    """
+    Rows of a dataframe as dictionaries of plain Python values, ready to be passed to executemany
+    """
+    return [{key: (int(value) if isinstance(value, np.integer) else value) for key, value in record.items()}
+            for record in df.to_dict("records")]
+
+
+def bulk_write(matches, engine, schema=None):
+    """
+    Writes a whole matchday in one transaction: one batched insert per team table, one batched insert into the
+    matches table if the schema has been migrated, and one batched UPDATE per league table. Points deductions are
+    applied when the tables are rebuilt (see create_home_away_tabes.py) and carried over by the updates. If any row
+    is rejected nothing is written.
+    :param matches: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    :param engine: sql connection engine
+    :param schema: league schema; if given the matches are also added to its ingest log and the league's data version
+                   is bumped in the same transaction
+    :return: number of matches written
+    """
+    if matches.empty:
+        return 0
+    rows = team_rows(matches)
+    if schema:
+        create_version_table(engine)
+    connection = engine.connect()
+    transaction = connection.begin()
+    try:
+        for (team, venue), group in rows.groupby(["team", "venue"]):
+            sql = text("INSERT INTO {0} ({1}) VALUES ({2})".format(str("`" + team + " " + venue + "`"),
+                                                                   ", ".join(TEAM_COLUMNS),
+                                                                   ", ".join(":" + c for c in TEAM_COLUMNS)))
+            connection.execute(sql, _records(group[TEAM_COLUMNS]))
+        for table, delta in league_table_deltas(rows).items():
+            sql = text("""
+                UPDATE {0}
+                SET mp=mp+:mp, w=w+:w, d=d+:d, l=l+:l, gf=gf+:gf, ga=ga+:ga, gd=gd+:gf-:ga, points=points+3*:w+:d
+                WHERE team=:team""".format(table))
+            params = _records(delta)
+            if params:
+                connection.execute(sql, params)
+        if uses_matches_table(engine):
+            connection.execute(matches_table.insert(), match_records(rows))
+        if schema:
+            log_matches(connection, matches)
+            version = bump_version(schema, connection)
+        transaction.commit()
+    except exc.IntegrityError:
+        transaction.rollback()
+        print("Attempted duplicate entry, no data written for these matches!")
+        return 0
+    except Exception:
+        transaction.rollback()
+        raise
+    finally:
+        connection.close()
+    if schema:
+        remember(schema, matches)
+        add_results(schema, matches, version)
+    return len(matches)
+
+
+def ingest(matches, schema, engine):
+    """
+    Idempotent version of bulk_write(). Matches already in the league's ingest log are dropped before any SQL is
+    issued, so replaying a feed never counts a result twice.
+    :param matches: dataframe with columns date, home_team, away_team, home_goals, away_goals
+    :param schema: name of league schema
+    :param engine: sql connection engine
+    :return: number of matches written
+    """
+    new_matches = filter_new(schema, matches, engine)
+    skipped = len(matches) - len(new_matches)
+    if skipped:
+        print("Skipping {} match(es) already written.".format(skipped))
+    return bulk_write(new_matches, engine, schema)
+
+
 def _table_write(tid, data, table, conn):
     """
     Helper function to write to league tables
@@ -154,32 +308,38 @@ def update_away_table(team_id, team_data, engine):
     connection.close()
 
 
+def ingest_feed(league):
+    """
+    Non-interactive ingest of every result in a league's RSS feed. Results already written are skipped, so this is
+    safe to run on a schedule.
+    :param league: league key (PL / C / L1 / L2)
+    :return: number of matches written
+    """
+    schema = SCHEMAS[league]
+    engine = connect_to_db(schema)
+    data = feedparser.parse(get_content(FEED_URLS[league], ttl=FEED_TTL))
+    matches = matches_frame(data, {entry.published for entry in data.entries})
+    written = ingest(matches, schema, engine)
+    print("{}: wrote {} new match(es).".format(schema, written))
+    return written
+
+
 def parse_data():
     """
     Writes data to league table and to individual team table.
     User is asked to enter which league first, then given a list of valid dates to choose from.
     :return:
     """
-    url_dict = {"PL": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1204",
-                "C": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1205",
-                "L1": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1206",
-                "L2": "https://www.soccerstats247.com/CompetitionFeed.aspx?langId=1&leagueId=1197"}
-
-    schema_dict = {"PL": "premier_league",
-                   "C": "championship",
-                   "L1": "league_one",
-                   "L2": "league_two"}
-
     league = str(input("What league to you want to add games for (PL / C / L1 / L2)? "))
 
-    while league not in url_dict.keys():
+    while league not in FEED_URLS.keys():
         print("Invalid input detected.")
         league = str(input(" Please select a league (PL / C / L1 / L2). "))
 
-    url = url_dict[league]
-    schema = schema_dict[league]
+    url = FEED_URLS[league]
+    schema = SCHEMAS[league]
     engine = connect_to_db(schema)
-    data = feedparser.parse(url)
+    data = feedparser.parse(get_content(url, ttl=FEED_TTL))
     valid_dates = []
 
     for i in range(len(data.entries)):
@@ -193,11 +353,8 @@ def parse_data():
 
     while len(date_list) < len(valid_dates):
         if requested_date.lower() == "all":
-            print("Are you sure? You may double up on league data! Enter \"Y\" to continue.")
-            is_sure = str(input())
-            if is_sure.lower() == "y":
-                date_list = valid_dates
-                print("Added all valid dates!")
+            date_list = valid_dates
+            print("Added all valid dates! Matches already written will be skipped.")
             break
         elif requested_date.lower() == "q":
             break
@@ -211,21 +368,10 @@ def parse_data():
     proceed = str(input("Do you wish to continue (Y/N)? "))
 
     if proceed.lower() == 'y':
-        if date_list:
-            print("\nWriting data...")
-
-        for i in range(len(data.entries)):
-            [date, home_team, home_team_df, home_team_id, away_team, away_team_df, away_team_id] = prepare_df(data,
-                                                                                                              i)
-            if date in date_list:
-                print("\nWriting data to...\n{}".format(home_team_df))
-                write_to_db(home_team_id, home_team_df, engine)
-                print("\nWriting data to...\n{}".format(away_team_df))
-                write_to_db(away_team_id, away_team_df, engine)
-                write_to_league_table(home_team, home_team_df, engine)
-                update_home_table(home_team, home_team_df, engine)
-                write_to_league_table(away_team, away_team_df, engine)
-                update_away_table(away_team, away_team_df, engine)
+        matches = matches_frame(data, date_list)
+        if not matches.empty:
+            print("\nWriting data...\n{}".format(matches))
+            ingest(matches, schema, engine)
 
         print("\nComplete!")
     else:
@@ -233,4 +379,9 @@ def parse_data():
 
 
 if __name__ == "__main__":
-    parse_data()
+    if len(sys.argv) > 1:
+        # e.g. "python write_results.py PL C L1 L2" ingests every feed without prompting
+        for key in sys.argv[1:]:
+            ingest_feed(key)
+    else:
+        parse_data()
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import pytest
+
+CODE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Code")
+sys.path.insert(0, CODE_DIRECTORY)
+
+import db_connection  # noqa: E402
+import ingest_log  # noqa: E402
+import prediction_cache  # noqa: E402
+import ratings_cache  # noqa: E402
+import rolling_ratings  # noqa: E402
+from benchmarks import generate_league, season_results  # noqa: E402
+from classes import TEAMS  # noqa: E402
+
+SCHEMA = 'league_two'
+
+INGEST = """
+import json
+import sys
+import pandas as pd
+sys.path.insert(0, {code!r})
+from db_connection import connect_to_db, set_backend
+from write_results import ingest
+set_backend('sqlite', {directory!r})
+print(ingest(pd.DataFrame(json.loads({matches!r})), {schema!r}, connect_to_db({schema!r})))
+"""
+
+
+def ingest_in_subprocess(matches, directory):
+    """
+    Runs write_results.ingest() in a separate process, as the ingest scripts do.
+
+    :return: number of matches written
+    """
+    script = INGEST.format(code=CODE_DIRECTORY, directory=directory, schema=SCHEMA,
+                           matches=matches.to_json(orient="records"))
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", script], stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+    return int(output.strip().splitlines()[-1])
+
+
+def _reset_caches():
+    ratings_cache.invalidate()
+    prediction_cache.clear()
+    rolling_ratings.reset()
+    ingest_log._known.clear()
+    ingest_log._high_water.clear()
+
+
+@pytest.fixture
+def season():
+    return season_results(TEAMS[SCHEMA], seed=1)
+
+
+@pytest.fixture
+def local_db(tmp_path):
+    """
+    Points connect_to_db() at SQLite files in a temporary directory, with every in-memory cache empty.
+
+    :return: the directory
+    """
+    db_connection.set_backend('sqlite', str(tmp_path))
+    _reset_caches()
+    yield str(tmp_path)
+    _reset_caches()
+    db_connection.dispose_engines()
+
+
+@pytest.fixture
+def league(local_db, season):
+    """
+    A local SQLite league_two with the first ten matchdays of a generated season written.
+
+    :return: (engine, directory holding the database)
+    """
+    return generate_league(SCHEMA, season[:10], local_db), local_db
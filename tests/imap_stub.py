@@ -0,0 +1,106 @@
+import socketserver
+import threading
+
+
+class ImapStub:
+    def __init__(self, idle=True):
+        """
+        Minimal IMAP server on localhost for the mail service tests: LOGIN, LIST, SELECT, NOOP, UID SEARCH/FETCH,
+        IDLE and LOGOUT against an in-memory inbox.
+
+        :param idle: whether IDLE is advertised
+        """
+        self.capabilities = b"IMAP4rev1 AUTH=PLAIN" + (b" IDLE" if idle else b"")
+        self.messages = []
+        self.logins = 0
+        self.idles = 0
+        # number of coming IDLE commands during which the server drops the connection
+        self.drop_idles = 0
+        # number of coming IDLE commands answered with an EXISTS in the same write as the continuation, as when mail
+        # arrives just before IDLE starts
+        self.exists_with_idle = 0
+        self._pushers = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                stub._serve(self.rfile, self.wfile)
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def deliver(self, raw):
+        """
+        Adds an unread message and tells every idling client about it.
+
+        :param raw: message bytes
+        """
+        with self._lock:
+            self.messages.append([raw, False])
+            for push in list(self._pushers):
+                push(b"* %d EXISTS\r\n" % len(self.messages))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _serve(self, rfile, wfile):
+        def send(data):
+            wfile.write(data)
+            wfile.flush()
+
+        send(b"* OK [CAPABILITY " + self.capabilities + b"] stub ready\r\n")
+        while True:
+            line = rfile.readline()
+            if not line:
+                return
+            parts = line.decode().strip().split(" ")
+            tag, command = parts[0].encode(), parts[1].upper()
+            if command == "CAPABILITY":
+                send(b"* CAPABILITY " + self.capabilities + b"\r\n" + tag + b" OK done\r\n")
+            elif command == "LOGIN":
+                self.logins += 1
+                send(tag + b" OK logged in\r\n")
+            elif command in ("LIST", "NOOP"):
+                send(tag + b" OK done\r\n")
+            elif command == "SELECT":
+                send(b"* %d EXISTS\r\n" % len(self.messages) + tag + b" OK [READ-WRITE] selected\r\n")
+            elif command == "LOGOUT":
+                send(b"* BYE logging out\r\n" + tag + b" OK done\r\n")
+                return
+            elif command == "IDLE":
+                self.idles += 1
+                if self.exists_with_idle:
+                    self.exists_with_idle -= 1
+                    send(b"+ idling\r\n* %d EXISTS\r\n" % len(self.messages))
+                else:
+                    send(b"+ idling\r\n")
+                if self.drop_idles:
+                    self.drop_idles -= 1
+                    return
+                with self._lock:
+                    self._pushers.append(send)
+                done = rfile.readline()
+                with self._lock:
+                    self._pushers.remove(send)
+                if not done:
+                    return
+                send(tag + b" OK IDLE terminated\r\n")
+            elif command == "UID" and parts[2].upper() == "SEARCH":
+                with self._lock:
+                    unseen = [str(i + 1).encode() for i, (_, seen) in enumerate(self.messages) if not seen]
+                send(b"* SEARCH " + b" ".join(unseen) + b"\r\n" + tag + b" OK done\r\n")
+            elif command == "UID" and parts[2].upper() == "FETCH":
+                response = b""
+                with self._lock:
+                    for uid in map(int, parts[3].split(",")):
+                        message = self.messages[uid - 1]
+                        message[1] = True
+                        response += b"* %d FETCH (UID %d RFC822 {%d}\r\n" % (uid, uid, len(message[0]))
+                        response += message[0] + b")\r\n"
+                send(response + tag + b" OK done\r\n")
+            else:
+                send(tag + b" BAD unknown command\r\n")
@@ -0,0 +1,14 @@
+import warnings
+from backtest import backtest, score
+from conftest import SCHEMA
+
+
+def test_backtest_runs_without_warnings(league, season):
+    engine, _ = league
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        predictions = backtest(SCHEMA, engine, min_games=0)
+    # the first matchday, and games where a side hasn't yet played at its venue, can't be priced
+    assert 0 < len(predictions) <= sum(len(matchday) for matchday in season[1:10])
+    assert predictions[["home win", "draw", "away win"]].notnull().all().all()
+    assert score(predictions)["matches"] == len(predictions)
@@ -0,0 +1,15 @@
+from bench_fixture_parser import generated_page, parse_fixtures_bs4, parse_fixtures_lxml
+from fixture_parser import parse_fixtures
+
+
+def test_lxml_parser_matches_the_old_parser():
+    page = generated_page()
+    dates = sorted({f.date.strftime("%d/%m/%y") for f in parse_fixtures(page)})
+    assert len(dates) == 46
+    postponed = 0
+    for date in dates:
+        expected = parse_fixtures_bs4(page, date)
+        assert parse_fixtures_lxml(page, date) == expected
+        assert expected
+        postponed += len(parse_fixtures(page, date)) - len(expected)
+    assert postponed > 0
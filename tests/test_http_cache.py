@@ -0,0 +1,26 @@
+import threading
+import http_cache
+
+
+def test_concurrent_stores_of_one_url(tmp_path, monkeypatch):
+    monkeypatch.setitem(http_cache._settings, "directory", str(tmp_path))
+    url = "https://example.com/fixtures"
+    errors = []
+
+    def store(i):
+        try:
+            for _ in range(50):
+                http_cache.store(url, "page {}".format(i).encode(), {"ETag": str(i)}, "utf-8")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=store, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    meta, body = http_cache.load(url)
+    assert body.decode().startswith("page ")
+    assert sorted(p.name for p in tmp_path.iterdir() if p.suffix == ".tmp") == []
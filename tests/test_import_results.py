@@ -0,0 +1,15 @@
+import pandas as pd
+from conftest import SCHEMA
+from import_results import import_files
+
+
+def test_dates_in_another_format_are_recognised(league, season, tmp_path):
+    # matchday 10 was written by the fixture in the feed's MM/DD/YYYY format, matchday 11 is new
+    matches = pd.concat([season[9], season[10]], ignore_index=True)
+    matches["date"] = pd.to_datetime(matches.date, format="%m/%d/%Y").dt.strftime("%d/%m/%Y")
+    unreadable = season[11].iloc[:1].assign(date="not a date")
+    path = str(tmp_path / "results.csv")
+    pd.concat([matches, unreadable], ignore_index=True).to_csv(path, index=False)
+
+    assert import_files(SCHEMA, [path], dayfirst=True) == len(season[10])
+    assert import_files(SCHEMA, [path], dayfirst=True) == 0
@@ -0,0 +1,31 @@
+import builtins
+from sqlalchemy import text
+import ratings_cache
+from conftest import SCHEMA
+from manual_team_data_entry import manual_write
+from matches_table import migrate, read_matches, uses_matches_table
+
+
+def test_manual_entry_reaches_the_matches_table(league, monkeypatch):
+    engine, _ = league
+    assert not uses_matches_table(engine)
+    migrate(SCHEMA, engine)
+    assert uses_matches_table(engine)
+    version = ratings_cache.get_version(SCHEMA, engine, max_age=0)
+
+    answers = iter(["L2", "Bradford City", "01/06/2020", "Walsall", "3-1", "y", "n"])
+    monkeypatch.setattr(builtins, "input", lambda prompt="": next(answers))
+    manual_write()
+
+    rows = read_matches(engine, team="Bradford City", venue="HOME")
+    assert [(r.opponent, r.goals_for, r.goals_against) for r in rows if str(r.match_date) == "2020-06-01"] == \
+        [("Walsall", 3, 1)]
+    rows = read_matches(engine, team="Walsall", venue="AWAY")
+    assert [(r.opponent, r.goals_for, r.goals_against) for r in rows if str(r.match_date) == "2020-06-01"] == \
+        [("Bradford City", 1, 3)]
+    connection = engine.connect()
+    logged = connection.execute(text("SELECT COUNT(*) FROM ingested_matches WHERE home_team = 'Bradford City' AND "
+                                     "away_team = 'Walsall' AND date = '06/01/2020'")).scalar()
+    connection.close()
+    assert logged == 1
+    assert ratings_cache.get_version(SCHEMA, engine, max_age=0) == version + 1
@@ -0,0 +1,20 @@
+import numpy as np
+import rating_fit
+import ratings_cache
+from conftest import SCHEMA, ingest_in_subprocess
+
+
+def test_write_in_another_process_is_refitted(league, season, monkeypatch):
+    engine, directory = league
+    monkeypatch.setattr(ratings_cache, "CHECK_INTERVAL", 0)
+    monkeypatch.setattr(rating_fit, "_fits", {})
+    before = rating_fit.get_fit(SCHEMA, engine)
+    assert rating_fit.get_fit(SCHEMA, engine) is before
+
+    assert ingest_in_subprocess(season[10], directory) == len(season[10])
+
+    after = rating_fit.get_fit(SCHEMA, engine)
+    assert len(after.matches) == len(before.matches) + len(season[10])
+    cold = rating_fit.fit(SCHEMA, engine, warm_start=False)
+    np.testing.assert_allclose(after.attack.values, cold.attack.values, atol=1e-3)
+    np.testing.assert_allclose(after.defence.values, cold.defence.values, atol=1e-3)
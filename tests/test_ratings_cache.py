@@ -0,0 +1,27 @@
+import pandas as pd
+import ratings_cache
+from classes import League
+from conftest import SCHEMA, ingest_in_subprocess
+
+
+def test_write_in_another_process_is_seen(league, season, monkeypatch):
+    engine, directory = league
+    monkeypatch.setattr(ratings_cache, "CHECK_INTERVAL", 0)
+    before = ratings_cache.get_ratings(SCHEMA, engine)
+
+    assert ingest_in_subprocess(season[10], directory) == len(season[10])
+
+    after = ratings_cache.get_ratings(SCHEMA, engine)
+    assert after.version == before.version + 1
+    expected = League(SCHEMA, engine).ratings(engine)
+    pd.testing.assert_frame_equal(after.ratings[expected.columns], expected)
+    assert not after.ratings[expected.columns].equals(before.ratings[expected.columns])
+
+
+def test_version_is_bumped_with_the_write(league, season):
+    engine, directory = league
+    version = ratings_cache.get_version(SCHEMA, engine, max_age=0)
+    assert ingest_in_subprocess(season[10], directory) == len(season[10])
+    # replaying the same matchday writes nothing and leaves the version alone
+    assert ingest_in_subprocess(season[10], directory) == 0
+    assert ratings_cache.get_version(SCHEMA, engine, max_age=0) == version + 1
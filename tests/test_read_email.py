@@ -0,0 +1,188 @@
+import threading
+import time
+import pytest
+import read_email
+from imap_stub import ImapStub
+from read_email import IdleSession, MailService, connect_email_read
+
+
+@pytest.fixture
+def stub():
+    server = ImapStub()
+    yield server
+    server.close()
+
+
+def _connect(stub):
+    return connect_email_read("service@example.com", "secret", "127.0.0.1", stub.port, use_ssl=False)
+
+
+def _request(subject):
+    return "From: me@example.com\r\nSubject: {}\r\n\r\nplease\r\n".format(subject).encode()
+
+
+def test_idle_returns_when_mail_arrives(stub):
+    mail = _connect(stub)
+    timer = threading.Timer(0.2, stub.deliver, [_request("league_two 19/10/19")])
+    timer.start()
+    start = time.monotonic()
+    assert IdleSession(mail).wait(timeout=10)
+    assert time.monotonic() - start < 5
+    assert mail.noop()[0] == "OK"
+    mail.logout()
+
+
+def test_idle_sees_mail_sent_with_the_continuation(stub):
+    stub.messages.append([_request("league_two 19/10/19"), False])
+    stub.exists_with_idle = 1
+    mail = _connect(stub)
+    start = time.monotonic()
+    assert IdleSession(mail).wait(timeout=5)
+    assert time.monotonic() - start < 1
+    assert mail.noop()[0] == "OK"
+    mail.logout()
+
+
+def test_idle_timeout_leaves_the_connection_usable(stub):
+    mail = _connect(stub)
+    session = IdleSession(mail)
+    assert not session.wait(timeout=0.2)
+    assert mail.noop()[0] == "OK"
+    assert not session.wait(timeout=0.2)
+    assert stub.idles == 2
+    mail.logout()
+
+
+def test_idle_raises_abort_when_the_server_drops(stub):
+    stub.drop_idles = 1
+    with pytest.raises(read_email.imaplib.IMAP4.abort):
+        IdleSession(_connect(stub)).wait(timeout=10)
+
+
+class RecordingSender:
+    def __init__(self):
+        self.sent = []
+        self.replied = threading.Event()
+
+    def send(self, to, subject, body):
+        self.sent.append((to, subject, body))
+        self.replied.set()
+
+    def close(self):
+        pass
+
+
+class BlockingFixtures:
+    """
+    Stands in for read_fixtures, holding every call until release() so that duplicate requests overlap.
+    """
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self.gate = threading.Event()
+
+    def __call__(self, league, date):
+        self.calls.append((league, date))
+        self.gate.wait(10)
+        if self.error is not None:
+            raise self.error
+        return [("Home", "Away", {"home win": 50.0, "draw": 25.0, "away win": 25.0, "over": 50.0})]
+
+    def release(self):
+        self.gate.set()
+
+
+def _service_with(monkeypatch, fixtures):
+    monkeypatch.setattr(read_email, "read_fixtures", fixtures)
+    service = MailService("service@example.com", "secret", "me@example.com", workers=4)
+    service.sender = RecordingSender()
+    return service
+
+
+def test_duplicate_requests_share_one_prediction(monkeypatch):
+    fixtures = BlockingFixtures()
+    service = _service_with(monkeypatch, fixtures)
+    futures = [service.submit(("league_two", "19/10/19")) for _ in range(5)]
+    fixtures.release()
+    service.close()
+    assert fixtures.calls == [("league_two", "19/10/19")]
+    assert len(set(futures)) == 1
+    assert len(service.sender.sent) == 5
+    assert not service._in_flight
+
+
+def test_duplicate_requests_all_see_a_failed_prediction(monkeypatch, capsys):
+    fixtures = BlockingFixtures(error=ValueError("no fixtures"))
+    service = _service_with(monkeypatch, fixtures)
+    for _ in range(3):
+        service.submit(("league_two", "19/10/19"))
+    fixtures.release()
+    service.close()
+    assert fixtures.calls == [("league_two", "19/10/19")]
+    assert service.sender.sent == []
+    assert capsys.readouterr().out.count("Failed to answer league_two 19/10/19: no fixtures") == 3
+    assert not service._in_flight
+
+
+def test_every_unread_request_gets_a_reply(stub, monkeypatch):
+    for subject in ["league_two 19/10/19", "league_two 19/10/19", "league_two 26/10/19", "league_two 19/10/19"]:
+        stub.messages.append([_request(subject), False])
+    fixtures = BlockingFixtures()
+    service = _service_with(monkeypatch, fixtures)
+    service.mail = _connect(stub)
+    assert service.process_unseen() == 4
+    fixtures.release()
+    service.close()
+    assert sorted(fixtures.calls) == [("league_two", "19/10/19"), ("league_two", "26/10/19")]
+    assert len(service.sender.sent) == 4
+
+
+def test_service_reconnects_and_answers_after_a_dropped_idle(stub, monkeypatch):
+    monkeypatch.setattr(read_email, "RECONNECT_DELAY", 0)
+    monkeypatch.setattr(read_email, "build_reply", lambda league, date: ("{} {}".format(league, date), "body"))
+    stub.drop_idles = 1
+    service = MailService("service@example.com", "secret", "me@example.com", imap_host="127.0.0.1",
+                          imap_port=stub.port, use_ssl=False, workers=1, idle_timeout=0.5)
+    service.sender = RecordingSender()
+    thread = threading.Thread(target=service.run, daemon=True)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 10
+        while stub.logins < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert stub.logins == 2
+        stub.deliver(_request("league_two 19/10/19"))
+        assert service.sender.replied.wait(10)
+        assert service.sender.sent == [("me@example.com", "league_two 19/10/19", "body")]
+    finally:
+        service.stop()
+        thread.join(10)
+        service.close()
+    assert not thread.is_alive()
+
+
+def test_service_can_run_with_a_fake_idle_session(monkeypatch):
+    # the IDLE exchange is the only part of the loop that needs a real server
+    class FakeIdle:
+        def __init__(self, mail):
+            self.waits = 0
+
+        def wait(self, timeout):
+            self.waits += 1
+            service.stop()
+            return False
+
+    class FakeMail:
+        capabilities = ("IMAP4REV1", "IDLE")
+
+        def uid(self, command, *args):
+            return "OK", [b""]
+
+        def logout(self):
+            pass
+
+    service = MailService("a", "b", "c", idle_session=FakeIdle)
+    monkeypatch.setattr(read_email, "connect_email_read", lambda *args: FakeMail())
+    service.run()
+    assert service.idler.waits == 1
+    service.close()
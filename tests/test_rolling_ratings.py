@@ -0,0 +1,33 @@
+import pandas as pd
+import ratings_cache
+import rolling_ratings
+from conftest import SCHEMA, ingest_in_subprocess
+from write_results import ingest
+
+
+def _fresh_ratings(engine, mode):
+    rolling_ratings.reset(SCHEMA)
+    return rolling_ratings.form_ratings(SCHEMA, engine, mode)
+
+
+def test_ingest_updates_form_in_place(league, season):
+    engine, _ = league
+    form = rolling_ratings.get_form(SCHEMA, engine)
+    for matchday in season[10:12]:
+        ingest(matchday, SCHEMA, engine)
+    assert rolling_ratings.get_form(SCHEMA, engine) is form
+    for mode in rolling_ratings.MODES:
+        updated = rolling_ratings.form_ratings(SCHEMA, engine, mode)
+        pd.testing.assert_frame_equal(updated, _fresh_ratings(engine, mode))
+
+
+def test_write_in_another_process_rebuilds_form(league, season, monkeypatch):
+    engine, directory = league
+    monkeypatch.setattr(ratings_cache, "CHECK_INTERVAL", 0)
+    before = rolling_ratings.form_ratings(SCHEMA, engine, 'recent')
+
+    assert ingest_in_subprocess(season[10], directory) == len(season[10])
+
+    after = rolling_ratings.form_ratings(SCHEMA, engine, 'recent')
+    assert not after.equals(before)
+    pd.testing.assert_frame_equal(after, _fresh_ratings(engine, 'recent'))
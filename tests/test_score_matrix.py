@@ -0,0 +1,42 @@
+import math
+import pytest
+from read_data import results_from_xg
+
+
+def _original_result_prob(home_xg, away_xg):
+    """
+    The nested-loop pricing get_result_prob() used before score_matrix.py, kept as the reference.
+    """
+    def goals(xg):
+        x = range(0, math.ceil(xg) + 6)
+        return [round((math.pow(xg, xi) * math.exp(-xg)) / math.factorial(xi), 5) for xi in x]
+
+    home_wins = draw = away_wins = prob_under = 0
+    for i, probability_i in enumerate(goals(home_xg)):
+        for j, probability_j in enumerate(goals(away_xg)):
+            result_probability = round(probability_i * probability_j, 5)
+            if i + j < 3:
+                prob_under += result_probability
+            if i < j:
+                away_wins += result_probability
+            elif i == j:
+                draw += result_probability
+            else:
+                home_wins += result_probability
+    return {"home win": round(100 * home_wins, 5), "draw": round(100 * draw, 5),
+            "away win": round(100 * away_wins, 5), "over": round(100 * (1 - prob_under), 5)}
+
+
+@pytest.mark.parametrize("home_xg", [0.0, 0.35, 0.987, 1.4, 2.123, 3.5, 4.816])
+@pytest.mark.parametrize("away_xg", [0.0, 0.412, 1.0, 1.15, 2.75, 5.3])
+def test_results_match_the_original_loop(home_xg, away_xg):
+    expected = _original_result_prob(home_xg, away_xg)
+    results = results_from_xg(home_xg, away_xg)
+    assert results.keys() == expected.keys()
+    for market, value in expected.items():
+        assert results[market] == pytest.approx(value, abs=1e-9)
+
+
+def test_results_are_pinned():
+    assert results_from_xg(1.4, 1.15) == {"home win": 42.659, "draw": 26.441, "away win": 30.886,
+                                          "over": 46.895}
@@ -0,0 +1,18 @@
+import numpy as np
+from benchmarks import generate_league
+from conftest import SCHEMA
+from ratings_cache import get_ratings
+from season_simulator import season_state, simulate
+
+
+def test_teams_without_games_at_a_venue(local_db, season):
+    engine = generate_league(SCHEMA, season[:1], local_db)
+    ratings = get_ratings(SCHEMA, engine).ratings
+    # after one matchday every team has played at exactly one venue
+    assert ratings.home_att.isnull().sum() == len(ratings) // 2
+    assert ratings.away_att.isnull().sum() == len(ratings) // 2
+
+    state = season_state(get_ratings(SCHEMA, engine))
+    assert np.isfinite(state["home_xg"]).all() and np.isfinite(state["away_xg"]).all()
+    table = simulate(SCHEMA, engine, seasons=200, batch_size=100, seed=0)
+    assert len(table) == len(ratings)
@@ -0,0 +1,24 @@
+import pandas as pd
+from sqlalchemy import text
+from classes import League
+from conftest import SCHEMA
+from create_home_away_tabes import TABLE_COLUMNS, aggregate_tables
+from write_results import ingest
+
+
+def _stored_table(engine, table):
+    connection = engine.connect()
+    rows = connection.execute(text("SELECT {} FROM {}".format(", ".join(TABLE_COLUMNS), table))).fetchall()
+    connection.close()
+    return pd.DataFrame(rows, columns=TABLE_COLUMNS).sort_values('team').reset_index(drop=True)
+
+
+def test_ingest_keeps_league_tables_in_line_with_a_rebuild(league, season):
+    engine, _ = league
+    for matchday in season[10:13]:
+        assert ingest(matchday, SCHEMA, engine) == len(matchday)
+
+    expected = aggregate_tables(League(SCHEMA, engine), engine)
+    for table, rebuilt in expected.items():
+        rebuilt = rebuilt.sort_values('team').reset_index(drop=True)
+        pd.testing.assert_frame_equal(_stored_table(engine, table), rebuilt, check_dtype=False)